@@ -4,9 +4,11 @@
 """
 
 from typing import Dict, List, Callable, Any, Optional
+from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
+from itertools import islice
 import asyncio
 import logging
 
@@ -79,8 +81,13 @@ class AgentEventBus:
         self._async_hooks: Dict[AgentEventType, List[Callable]] = {}
         self._global_sync_hooks: List[Callable] = []
         self._global_async_hooks: List[Callable] = []
-        self._event_history: List[AgentEvent] = []
         self._max_history_size = 1000
+        # deque(maxlen)自动淘汰最旧事件；按类型再建一份索引，
+        # 按类型查询时不用遍历全量历史。类型索引在emit时跟随
+        # 全局窗口同步剔除被挤出的事件，始终是全局历史的子集，
+        # 所以自身不需要maxlen
+        self._event_history: deque = deque(maxlen=self._max_history_size)
+        self._history_by_type: Dict[AgentEventType, deque] = {}
 
     def register_hook(self, event_type: AgentEventType, hook: Callable, is_async: bool = False):
         """注册事件钩子
@@ -125,10 +132,21 @@ class AgentEventBus:
 
     async def emit(self, event: AgentEvent):
         """发射事件"""
-        # 记录事件历史
+        # 记录事件历史（maxlen自动丢弃最旧的）。全局窗口已满时
+        # 本次append会挤出最旧事件，同步从它的类型索引里剔除，
+        # 保证按类型查询不会返回早已滚出全局窗口的事件
+        evicted = None
+        if len(self._event_history) == self._max_history_size:
+            evicted = self._event_history[0]
         self._event_history.append(event)
-        if len(self._event_history) > self._max_history_size:
-            self._event_history.pop(0)
+        by_type = self._history_by_type.get(event.event_type)
+        if by_type is None:
+            by_type = self._history_by_type.setdefault(event.event_type, deque())
+        by_type.append(event)
+        if evicted is not None:
+            stale = self._history_by_type.get(evicted.event_type)
+            if stale and stale[0] is evicted:
+                stale.popleft()
 
         logger.debug(f"Emitting event: {event.event_type.value} for session {event.session_id}")
 
@@ -165,22 +183,33 @@ class AgentEventBus:
             event_type: 事件类型过滤
             limit: 返回数量限制
         """
-        events = self._event_history
+        # 指定类型时直接走按类型索引，从右往左惰性过滤到limit即停
+        if event_type:
+            source = self._history_by_type.get(event_type, ())
+        else:
+            source = self._event_history
 
         if session_id:
-            events = [e for e in events if e.session_id == session_id]
-
-        if event_type:
-            events = [e for e in events if e.event_type == event_type]
+            candidates = (e for e in reversed(source) if e.session_id == session_id)
+        else:
+            candidates = reversed(source)
 
-        return events[-limit:]
+        newest_first = list(islice(candidates, limit))
+        newest_first.reverse()
+        return newest_first
 
     def clear_history(self, session_id: Optional[str] = None):
         """清理事件历史"""
         if session_id:
-            self._event_history = [e for e in self._event_history if e.session_id != session_id]
+            kept = [e for e in self._event_history if e.session_id != session_id]
+            self._event_history = deque(kept, maxlen=self._max_history_size)
+            for etype, events in self._history_by_type.items():
+                self._history_by_type[etype] = deque(
+                    e for e in events if e.session_id != session_id
+                )
         else:
             self._event_history.clear()
+            self._history_by_type.clear()
 
 
 class AgentHookManager:
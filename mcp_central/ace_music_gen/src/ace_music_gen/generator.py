@@ -1,10 +1,13 @@
 """主要的音乐生成器模块"""
 
+import hashlib
 import os
-import glob
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Optional
 
+import numpy as np
+
 # ACE-Step库的导入
 try:
     # 尝试从系统安装的ace-step包导入
@@ -35,15 +38,82 @@ from .evaluator import AudioEvaluator
 from .llm_client import LLMClient
 
 
+class TextEmbeddingDiskCache:
+    """文本Embedding磁盘缓存
+
+    以prompt哈希为键，把文本编码器的输出持久化到磁盘，
+    同样的prompt在进程重启后也能跳过文本编码的前向计算。
+    """
+
+    def __init__(self, cache_dir: str = "./.mcp_cache/text_emb", max_entries: int = 256):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        """计算prompt的缓存键"""
+        return hashlib.blake2b(text.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pt")
+
+    def get(self, text: str):
+        """查询缓存，未命中或读取失败时返回None"""
+        path = self._entry_path(self.make_key(text))
+        if not os.path.exists(path):
+            return None
+        try:
+            import torch
+            # 更新访问时间，供LRU淘汰使用
+            os.utime(path, None)
+            return torch.load(path, map_location="cpu")
+        except Exception:
+            return None
+
+    def put(self, text: str, value):
+        """写入缓存，失败时静默跳过（缓存只是加速手段）"""
+        try:
+            import torch
+            os.makedirs(self.cache_dir, exist_ok=True)
+            torch.save(value, self._entry_path(self.make_key(text)))
+            self._evict_if_needed()
+        except Exception:
+            pass
+
+    def _evict_if_needed(self):
+        """按访问时间做简单的LRU淘汰，控制缓存目录大小"""
+        try:
+            with os.scandir(self.cache_dir) as it:
+                entries = [(entry.stat().st_atime, entry.path) for entry in it if entry.is_file()]
+        except OSError:
+            return
+
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort()
+        for _, path in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
 class SimpleACEMusicGen:
     """简单的ACE音乐生成器"""
     
-    def __init__(self):
+    def __init__(self, bf16: Optional[bool] = None):
         self.llm_client = LLMClient()
-        # 自动从网络下载模型，Mac设置bf16=False
-        self.pipeline = ACEStepPipeline(bf16=False)
+        # 自动从网络下载模型
+        # CUDA且硬件支持时默认开启bf16，Mac/MPS等其他设备保持FP32
+        if bf16 is None:
+            bf16 = self._detect_bf16_support()
+        self.pipeline = ACEStepPipeline(bf16=bf16)
         # 初始化音频评估器
         self.audio_evaluator = AudioEvaluator()
+        # AI评价走网络，放到后台线程，不阻塞音频返回
+        self._llm_pool = ThreadPoolExecutor(max_workers=1)
+        self._last_llm_evaluation_future = None
         # 默认的guidance调度曲线（可通过set_guidance_schedule覆盖）
         self.guidance_schedule = [
             {"position": 0.0, "scale": 10.0},
@@ -51,11 +121,24 @@ class SimpleACEMusicGen:
             {"position": 0.75, "scale": 12.0},
             {"position": 1.0, "scale": 9.0},
         ]
+        self._normalized_schedule = self._normalize_schedule(self.guidance_schedule)
         self.candidate_count = 1
         self.audio_duration = 120
         self.enable_text_cache = True
         self.enable_lyric_cache = True
-        
+        # 文本Embedding的持久化缓存（同样的prompt跨进程复用）
+        self.text_embedding_cache = TextEmbeddingDiskCache()
+        self._wrap_text_encoder_with_cache()
+
+    @staticmethod
+    def _detect_bf16_support() -> bool:
+        """检测当前设备是否适合开启bf16"""
+        try:
+            import torch
+            return bool(torch.cuda.is_available() and torch.cuda.is_bf16_supported())
+        except Exception:
+            return False
+
     def setup_api(self, api_key: str):
         """设置API密钥"""
         self.llm_client.setup_api(api_key)
@@ -63,6 +146,35 @@ class SimpleACEMusicGen:
     def set_guidance_schedule(self, schedule):
         """设置自定义guidance调度曲线"""
         self.guidance_schedule = schedule
+        # 解析一次并缓存，后续每次生成直接读取
+        self._normalized_schedule = self._normalize_schedule(schedule)
+
+    @staticmethod
+    def _normalize_schedule(schedule):
+        """把调度节点统一解析为(positions, scales)两个ndarray
+
+        节点可以是dict（position/progress/t + scale/value）或序列，
+        无法解析的节点用NaN占位，展示时回退到原始节点。
+        """
+        positions = []
+        scales = []
+        for node in schedule or []:
+            position = None
+            scale = None
+            if isinstance(node, dict):
+                position = node.get("position", node.get("progress", node.get("t")))
+                scale = node.get("scale", node.get("value"))
+            elif isinstance(node, (list, tuple)) and len(node) >= 2:
+                position, scale = node[0], node[1]
+
+            try:
+                positions.append(float(position))
+                scales.append(float(scale))
+            except (TypeError, ValueError):
+                positions.append(np.nan)
+                scales.append(np.nan)
+
+        return np.asarray(positions), np.asarray(scales)
 
     def generate_music_params(self, user_idea: str) -> Dict[str, str]:
         """单独生成歌词和Prompt，供多代理流程使用"""
@@ -94,6 +206,35 @@ class SimpleACEMusicGen:
         """开关歌词Token缓存"""
         self.enable_lyric_cache = bool(enabled)
 
+    def _wrap_text_encoder_with_cache(self):
+        """为pipeline的文本编码入口套上磁盘缓存
+
+        不同版本的ACE-Step暴露的文本编码方法名不尽相同，这里按常见
+        名称逐个探测；都不存在时保持原样，缓存只是可选的加速手段。
+        """
+        for method_name in ("get_text_embeddings", "encode_text"):
+            original = getattr(self.pipeline, method_name, None)
+            if not callable(original):
+                continue
+
+            cache = self.text_embedding_cache
+
+            def cached_encoder(prompt, *args, _original=original, **kwargs):
+                # 缓存键只有prompt本身，带额外位置/关键字参数的调用
+                # （device、标志位等）一律绕过缓存，避免串结果
+                if not (self.enable_text_cache and isinstance(prompt, str)
+                        and not args and not kwargs):
+                    return _original(prompt, *args, **kwargs)
+                hit = cache.get(prompt)
+                if hit is not None:
+                    return hit
+                result = _original(prompt, *args, **kwargs)
+                cache.put(prompt, result)
+                return result
+
+            setattr(self.pipeline, method_name, cached_encoder)
+            break
+
     def generate_and_create_music(
         self,
         user_idea: str,
@@ -117,38 +258,18 @@ class SimpleACEMusicGen:
         print("\n第二步：开始生成音乐...")
         active_guidance_schedule = guidance_schedule or self.guidance_schedule
         if active_guidance_schedule:
-            print("使用Guidance调度曲线:")
-            for node in active_guidance_schedule:
-                position = None
-                scale = None
-                if isinstance(node, dict):
-                    if "position" in node:
-                        position = node["position"]
-                    elif "progress" in node:
-                        position = node["progress"]
-                    elif "t" in node:
-                        position = node["t"]
-
-                    if "scale" in node:
-                        scale = node["scale"]
-                    elif "value" in node:
-                        scale = node["value"]
-                elif isinstance(node, (list, tuple)) and len(node) >= 2:
-                    position, scale = node[0], node[1]
+            # 自身的调度已在set_guidance_schedule时解析并缓存
+            if active_guidance_schedule is self.guidance_schedule:
+                positions, scales = self._normalized_schedule
+            else:
+                positions, scales = self._normalize_schedule(active_guidance_schedule)
 
-                try:
-                    if position is not None:
-                        position = float(position)
-                    if scale is not None:
-                        scale = float(scale)
-                except (TypeError, ValueError):
-                    position = None
-                    scale = None
-
-                if position is not None and scale is not None:
-                    print(f"  - position={position:.2f}, scale={scale:.2f}")
-                else:
+            print("使用Guidance调度曲线:")
+            for node, position, scale in zip(active_guidance_schedule, positions, scales):
+                if np.isnan(position) or np.isnan(scale):
                     print(f"  - {node}")
+                else:
+                    print(f"  - position={position:.2f}, scale={scale:.2f}")
 
         candidate_reports = []
 
@@ -250,6 +371,7 @@ class SimpleACEMusicGen:
 
         # 第三步：音频质量评估
         print("\n第三步：分析音频质量...")
+        self._last_llm_evaluation_future = None
         if selected_evaluation:
             self._display_evaluation_results(selected_evaluation)
             audio_evaluation = selected_evaluation
@@ -257,9 +379,11 @@ class SimpleACEMusicGen:
             audio_evaluation = self._evaluate_generated_audio(result)
 
         # 将评估结果和原始结果一起返回
+        # AI评价在后台生成，需要时可通过future取回
         return {
             "ace_step_result": result,
-            "audio_evaluation": audio_evaluation
+            "audio_evaluation": audio_evaluation,
+            "llm_evaluation_future": self._last_llm_evaluation_future
         }
     
     def _evaluate_generated_audio(self, result):
@@ -309,13 +433,21 @@ class SimpleACEMusicGen:
                 return evaluation_from_metadata
 
             # 如果没有找到路径，尝试查找outputs目录中最新的文件
+            # scandir的DirEntry自带stat缓存，一次遍历即可取到创建时间
             if not audio_path:
                 output_dir = "./outputs"
-                if os.path.exists(output_dir):
-                    wav_files = glob.glob(os.path.join(output_dir, "*.wav"))
-                    if wav_files:
-                        # 获取最新的wav文件
-                        audio_path = max(wav_files, key=os.path.getctime)
+                try:
+                    with os.scandir(output_dir) as it:
+                        wav_files = [
+                            (entry.stat().st_ctime, entry.path)
+                            for entry in it
+                            if entry.name.endswith('.wav') and entry.is_file()
+                        ]
+                except FileNotFoundError:
+                    wav_files = []
+                if wav_files:
+                    # 获取最新的wav文件
+                    audio_path = max(wav_files)[1]
             
             if audio_path and os.path.exists(audio_path):
                 print(f"正在分析音频文件: {audio_path}")
@@ -357,12 +489,12 @@ class SimpleACEMusicGen:
             if scores.get('pesq_score'):
                 print(f"   感知质量: {scores['pesq_score']:.1f}/4.5")
         
-        # 获取LLM专业评价
-        print(f"\n正在生成AI专业评价...")
-        llm_evaluation = self.llm_client.generate_music_evaluation(evaluation)
-        
-        print(f"\nAI音乐评价:")
-        print(f"{llm_evaluation}")
+        # LLM专业评价是网络调用，提交到后台线程生成
+        # 调用方拿到音频和技术评分即可返回，评价生成完毕后可随时取回
+        print(f"\nAI专业评价已在后台生成...")
+        future = self._llm_pool.submit(self.llm_client.generate_music_evaluation, evaluation)
+        self._last_llm_evaluation_future = future
+        return future
 
 
 def main():
@@ -380,6 +512,12 @@ def main():
             result = generator.generate_and_create_music(user_input)
             print(f"\n 音乐生成完成！")
             print(f"音频文件已保存到: ./outputs/ 目录")
+
+            # CLI场景下用户还在终端前，等待后台的AI评价并展示
+            llm_future = result.get("llm_evaluation_future")
+            if llm_future is not None:
+                print(f"\nAI音乐评价:")
+                print(llm_future.result())
             print("="*50 + "\n")
         except Exception as e:
             print(f"生成失败: {e}")
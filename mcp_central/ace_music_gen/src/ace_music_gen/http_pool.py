@@ -0,0 +1,31 @@
+"""进程级共享HTTP连接池
+
+LLMClient和ACEStepMCPClient各自持有Session会得到两套独立的
+urllib3连接池。这里把HTTPAdapter做成模块级单例，两边的Session
+挂载同一个adapter，TCP连接、DNS解析和TLS会话在整个进程内复用；
+headers/cookies仍然留在各自的Session上，互不串台。
+"""
+
+import atexit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 单个共享连接池：8个host桶，每个host最多32条keep-alive连接
+_ADAPTER = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+atexit.register(_ADAPTER.close)
+
+
+def get_session() -> requests.Session:
+    """返回挂载了共享连接池的新Session
+
+    每个调用方拿到独立的Session（可自由设置headers等会话态），
+    底层连接复用同一个池。
+    """
+    session = requests.Session()
+    session.mount("https://", _ADAPTER)
+    session.mount("http://", _ADAPTER)
+    return session
+
+
+__all__ = ["get_session"]
@@ -0,0 +1,35 @@
+"""快速ID生成工具
+
+uuid.uuid4()每次调用都读16字节/dev/urandom再走纯Python格式化。
+这里按线程预取一大块随机量，从中切出UUID，批量摊薄系统调用；
+格式化用bytes.hex()加切片拼接，比uuid.UUID的构造便宜得多。
+生成的字符串仍是符合RFC 4122的version 4 UUID。
+"""
+
+import os
+import threading
+
+# 一次urandom系统调用取足1024个UUID的随机量
+_POOL_BYTES = 16 * 1024
+
+_local = threading.local()
+
+
+def fast_uuid4_str() -> str:
+    """返回一个标准36字符的UUID4字符串（线程本地随机池）"""
+    pos = getattr(_local, "pos", _POOL_BYTES)
+    if pos >= _POOL_BYTES:
+        _local.buf = os.urandom(_POOL_BYTES)
+        pos = 0
+    raw = bytearray(_local.buf[pos:pos + 16])
+    _local.pos = pos + 16
+
+    # 按RFC 4122打上version 4和variant位
+    raw[6] = (raw[6] & 0x0F) | 0x40
+    raw[8] = (raw[8] & 0x3F) | 0x80
+
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+__all__ = ["fast_uuid4_str"]
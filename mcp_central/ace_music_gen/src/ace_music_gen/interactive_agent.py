@@ -3,10 +3,18 @@
 基于多轮对话的音乐生成Agent，支持需求收集、歌词生成确认、参数调优等功能
 """
 
+import dataclasses
+import functools
+import hashlib
+import json
+import logging
 import os
+import random
 import re
+import sys
 import time
-from typing import List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 
 from .session_state import (
@@ -20,7 +28,193 @@ from .session_state import (
 )
 from .llm_client import LLMClient
 from .mcp_client import ACEStepMCPClient
-from .pinyin_helper import annotate_polyphonic_lyrics, get_polyphonic_stats
+from .pinyin_helper import annotate_with_stats
+
+
+# 已知主题关键词 -> (风格, 情绪, 主题, 分析文案)
+# 命中任意关键词即可直接确定需求，跳过LLM分析调用
+_THEME_KEYWORD_PROFILES = {}
+for _keywords, _profile in [
+    (
+        ("爱国", "国家", "祖国"),
+        ("流行", "激昂", "爱国情怀",
+         "我理解您想要一首体现爱国情怀的音乐。这类音乐通常情感激昂，能够激发人们的爱国热情。"),
+    ),
+    (
+        ("悲伤", "难过", "失恋"),
+        ("民谣", "悲伤", "悲伤情感",
+         "我感受到您想要表达悲伤或失落的情感。民谣风格很适合传达这种深层的情感体验。"),
+    ),
+    (
+        ("快乐", "开心", "庆祝"),
+        ("流行", "快乐", "快乐庆祝",
+         "我听出您想要轻快愉悦的音乐！流行风格能很好地表达这种积极向上的情绪。"),
+    ),
+]:
+    for _keyword in _keywords:
+        _THEME_KEYWORD_PROFILES[_keyword] = _profile
+
+# 单个正则交替一次线性扫描全部关键词，替代逐个`in`判断
+_THEME_KEYWORD_PATTERN = re.compile("|".join(map(re.escape, _THEME_KEYWORD_PROFILES)))
+
+# 特殊要求的整句直译表
+_SPECIAL_REQUEST_TRANSLATIONS = {
+    "希望感情很厚重": "deep emotional, rich feeling, intense",
+    "要有吉他solo": "guitar solo, guitar lead",
+    "节奏要快一些": "fast tempo, upbeat rhythm",
+    "节奏要慢一些": "slow tempo, gentle rhythm",
+    "要有电子音效": "electronic effects, synthesizer",
+    "声音要清澈": "clear vocals, crisp sound",
+    "要有和声": "harmony, backing vocals",
+    "要有说唱部分": "rap section, hip-hop elements"
+}
+
+# 关键词 -> 英文短语，整句直译未命中时做一次线性扫描
+_SPECIAL_REQUEST_KEYWORDS = {
+    "吉他": "guitar elements",
+    "guitar": "guitar elements",
+    "节奏快": "fast tempo",
+    "快节奏": "fast tempo",
+    "节奏慢": "slow tempo",
+    "慢节奏": "slow tempo",
+    "厚重": "deep, rich",
+    "深沉": "deep, rich",
+    "清澈": "clear, crisp",
+    "清晰": "clear, crisp",
+    "电子": "electronic"
+}
+_SPECIAL_REQUEST_PATTERN = re.compile(
+    "|".join(map(re.escape, _SPECIAL_REQUEST_KEYWORDS))
+)
+
+# 歌词清理用的正则，模块导入时编译一次
+# （原先的r'...\\s*'写法匹配的是字面反斜杠+s，这里一并修正）
+_RE_LYRICS_PREFIX = re.compile(r'^歌词[:：]?\s*')
+_RE_BRACKET_HEADER = re.compile(r'^[【\[].*?[】\]]\s*')
+_RE_CODE_FENCE = re.compile(r'```.*?```', re.DOTALL)
+# 只去掉围栏标记本身（LLM返回的JSON常被```json ... ```包裹）
+_RE_CODE_FENCE_MARK = re.compile(r'```(?:json)?')
+
+# 风格/情绪 -> 英文技术描述
+_STYLE_PROMPTS = {
+    "说唱": "Rap, hip-hop, rhythmic, urban, strong beat",
+    "流行": "Pop, mainstream, catchy, melodic, contemporary",
+    "摇滚": "Rock, energetic, guitar-driven, powerful, dynamic",
+    "民谣": "Folk, acoustic, natural, storytelling, gentle",
+    "电子": "Electronic, synthesized, digital, modern, pulsing"
+}
+
+_MOOD_PROMPTS = {
+    "悲伤": "melancholic, sad, emotional, slow tempo",
+    "愤怒": "angry, aggressive, intense, heavy",
+    "快乐": "happy, upbeat, joyful, lively",
+    "温柔": "gentle, soft, warm, tender",
+    "激昂": "energetic, passionate, powerful, uplifting",
+    "忧郁": "melancholic, moody, introspective, dark",
+    "浪漫": "romantic, loving, intimate, sweet",
+    "怀旧": "nostalgic, reminiscent, wistful, vintage",
+    "励志": "inspiring, motivational, uplifting, hopeful",
+    "平静": "calm, peaceful, serene, relaxed"
+}
+
+
+def _translate_requests(requests: Tuple[str, ...]) -> List[str]:
+    """将中文特殊要求转换为英文短语列表"""
+    english_requests = []
+    for request in requests:
+        # 整句直译优先
+        if request in _SPECIAL_REQUEST_TRANSLATIONS:
+            english_requests.append(_SPECIAL_REQUEST_TRANSLATIONS[request])
+            continue
+
+        # 一次线性扫描收集命中的关键词短语，保序去重
+        phrases = []
+        for match in _SPECIAL_REQUEST_PATTERN.finditer(request.lower()):
+            phrase = _SPECIAL_REQUEST_KEYWORDS[match.group()]
+            if phrase not in phrases:
+                phrases.append(phrase)
+
+        if phrases:
+            english_requests.extend(phrases)
+        else:
+            # 对于无法识别的要求，使用通用描述
+            english_requests.append("expressive")
+
+    return english_requests
+
+
+@functools.lru_cache(maxsize=1024)
+def _english_prompt_for(style: str, mood: str, requests: Tuple[str, ...]) -> str:
+    """由(风格, 情绪, 特殊要求)生成英文prompt，结果可缓存复用"""
+    style_desc = _STYLE_PROMPTS.get(style, style)
+
+    # 处理复合情绪（如："激昂, 励志"）
+    mood_parts = []
+    if mood:
+        for mood_keyword in mood.split(','):
+            english_mood = _MOOD_PROMPTS.get(mood_keyword.strip(), "")
+            if english_mood:
+                mood_parts.append(english_mood)
+
+    mood_desc = ", ".join(mood_parts) if mood_parts else "emotional"
+
+    # 组合prompt
+    prompt_parts = [style_desc, mood_desc, "Chinese male vocals", "clear vocals"]
+
+    # 处理特殊要求 - 转换为英文
+    if requests:
+        prompt_parts.extend(_translate_requests(requests))
+
+    return ", ".join(prompt_parts)
+
+
+# 歌词创作的稳定system前缀：与变化的需求字段分开、逐字节一致，
+# 服务端的prompt前缀缓存（KV复用）才能在多次调用间命中
+_LYRICS_SYSTEM_PROMPT = """你是一位专业的中文歌词创作人。请根据用户需求创作一首歌词。
+
+创作要求:
+1. 歌词要有真实的情感表达，贴近主题
+2. 语言要生动有力，有画面感
+3. 节奏要符合用户指定的风格
+4. 歌词长度要与用户指定的时长相称
+5. 避免使用过于复杂或生僻的词汇
+6. 要有层次感，包含主歌、副歌等结构
+
+请直接输出歌词内容，不要加其他说明。"""
+
+# 歌词修改的稳定system前缀
+_LYRICS_REVISE_SYSTEM_PROMPT = """用户会提供一段歌词和修改意见，请根据反馈进行调整。
+保持歌词的整体结构和韵律，但要满足用户的要求。
+请直接输出修改后的歌词，不要加其他说明。"""
+
+# 风格 -> 歌词创作指导
+_STYLE_GUIDES = {
+    "说唱": "节奏感强，韵脚明显，可以有一些街头文化元素，语言可以更直接有力",
+    "流行": "朗朗上口，易于传唱，情感表达要真挚自然，有一定的流行元素",
+    "摇滚": "有力量感，可以有一些叛逆或激情的元素，语言要有冲击力",
+    "民谣": "质朴自然，有故事性，语言要温暖真实，贴近生活",
+    "电子": "现代感强，可以有一些科技或未来元素，节奏要明快"
+}
+_DEFAULT_STYLE_GUIDE = "保持音乐风格的特色，语言要有感染力"
+
+# 风格 -> guidance调度的(position, scale)节点元组
+_GUIDANCE_SCHEDULES = {
+    # 说唱需要更强的节奏控制
+    "说唱": ((0.0, 12.0), (0.3, 18.0), (0.7, 15.0), (1.0, 10.0)),
+    # 摇滚需要更强的动态变化
+    "摇滚": ((0.0, 8.0), (0.2, 20.0), (0.8, 16.0), (1.0, 6.0)),
+}
+_BASE_GUIDANCE_SCHEDULE = ((0.0, 10.0), (0.4, 16.0), (0.8, 12.0), (1.0, 8.0))
+
+
+def _style_guidance_for(style: str) -> str:
+    """纯字典查找的风格指导"""
+    return _STYLE_GUIDES.get(style, _DEFAULT_STYLE_GUIDE)
+
+
+def _guidance_schedule_for(style: str) -> Tuple[Tuple[float, float], ...]:
+    """按风格返回(position, scale)节点元组，调用方负责转成可变结构"""
+    return _GUIDANCE_SCHEDULES.get(style, _BASE_GUIDANCE_SCHEDULE)
 
 
 class InteractiveMusicAgent:
@@ -38,45 +232,67 @@ class InteractiveMusicAgent:
         self.session = MusicSessionState()
         self.memory_provider = None  # 预留长期记忆接口
 
+        # 过程性输出走logging而不是print：Web部署下不再为每行
+        # 诊断信息强制flush stdout，也便于按会话接管日志流
+        self.log = logging.getLogger("ace_agent")
+        if self.config.cli_mode:
+            self._attach_cli_log_handler()
+
+        # 后台任务池：拼音标注等纯计算在用户审核歌词时提前算好，
+        # 不占用进入生成阶段的关键路径
+        self._pool = ThreadPoolExecutor(max_workers=2)
+        self._pinyin_future = None
+        self._pinyin_source = None  # future对应的歌词文本，用于失效判断
+
+        # 以GenerationParams内容为键的本地结果缓存：同一会话内
+        # 完全相同的参数重复提交时直接复用已生成的结果
+        self._generation_cache: Dict[str, MusicGenerationResult] = {}
+
+        # 后台预热LLM连接，首次真实调用不再吃TLS握手延迟
+        self._pool.submit(self.llm_client.ping)
+
+    def _attach_cli_log_handler(self):
+        """给CLI模式挂一个裸消息格式的stdout处理器（幂等）"""
+        if any(getattr(handler, "_ace_cli", False) for handler in self.log.handlers):
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler._ace_cli = True
+        self.log.addHandler(handler)
+        self.log.setLevel(logging.INFO)
+
     def run_dialog(self) -> MusicGenerationResult:
-        """运行完整的对话流程"""
+        """运行完整的对话流程（控制台入口）
+
+        只是handle_event状态机之上的stdin薄封装：读取一行输入、
+        交给状态机、打印回复，直到会话进入终态。Web端通过
+        process_user_input驱动同一个状态机，两种入口不再各走一套
+        互不兼容的流程。
+        """
         try:
-            self.session.update_stage("collecting_requirements")
+            self._attach_cli_log_handler()
             self.session.add_debug_log("开始交互式音乐生成流程")
+            print("\n🎵 欢迎使用 ACE 音乐生成助手！")
+            print("我将帮助您创作个性化的音乐作品。")
 
-            # 1. 收集用户需求
-            user_requirement = self._collect_user_requirements()
-            self.session.user_requirement = user_requirement
-
-            # 2. 生成歌词候选
-            self.session.update_stage("generating_lyrics")
-            lyrics_candidates = self._generate_lyrics_candidates()
-
-            # 3. 用户确认歌词
-            self.session.update_stage("reviewing_lyrics")
-            final_lyrics = self._review_with_user(lyrics_candidates)
-
-            # 4. 构建生成参数
-            generation_params = self._build_generation_params(final_lyrics)
-            self.session.generation_params = generation_params
-
-            # 5. 准备歌词用于生成
-            prepared_lyrics = self._prepare_lyrics_for_generation(final_lyrics)
-
-            # 🔥 修复：将拼音标注版本写回generation_params.lyrics
-            generation_params.lyrics = prepared_lyrics
-
-            # 6. 调用MCP生成音乐
-            self.session.update_stage("generating_music")
-            result = self._invoke_mcp(generation_params)
-
-            self.session.generation_result = result
-            if result.success:
-                self.session.update_stage("completed")
-            else:
-                self.session.update_stage("failed")
+            expected = "user_message"
+            while expected != "none":
+                user_input = input("\n请输入（描述需求或反馈意见）: ").strip()
+                if not user_input:
+                    continue
+                response, expected = self.handle_event(
+                    {"kind": "user_message", "text": user_input}
+                )
+                print(f"\n{response}")
 
-            return result
+            result = getattr(self.session, "final_result", None) or self.session.generation_result
+            if result:
+                return result
+            return MusicGenerationResult(
+                success=False,
+                error="会话结束但未产生生成结果",
+                session_id=self.session.session_id
+            )
 
         except Exception as e:
             error_msg = f"Agent运行失败: {str(e)}"
@@ -88,6 +304,52 @@ class InteractiveMusicAgent:
                 session_id=self.session.session_id
             )
 
+    def handle_event(self, event: Dict[str, Any]) -> Tuple[str, str]:
+        """处理一个结构化事件并立即返回控制权
+
+        事件形如 {"kind": "user_message", "text": "..."}。返回
+        (回复文本, 期待的下一个事件kind)，"none"表示会话已到终态。
+        所有阻塞点（LLM、MCP）都发生在事件处理内部，事件之间
+        不会停在input()上等人，批量/Web场景可以并发驱动多个会话。
+        """
+        kind = event.get("kind", "user_message")
+        if kind != "user_message":
+            return (f"暂不支持的事件类型: {kind}", "user_message")
+
+        text = (event.get("text") or "").strip()
+        response = self.process_user_input(text)
+
+        # 需求一旦解析完成，立即推进到歌词生成并呈现给用户审核，
+        # 不需要用户再发一条消息来触发
+        if (
+            self.session.current_stage == "collecting_requirements"
+            and self.session.user_requirement
+            and not self.session.lyrics_versions
+        ):
+            response = self._advance_to_lyrics_review(response)
+
+        next_kind = "none" if self.session.current_stage in ("completed", "failed") else "user_message"
+        return (response, next_kind)
+
+    def _advance_to_lyrics_review(self, previous_response: str) -> str:
+        """生成歌词候选并进入审核阶段，返回带歌词的回复文本"""
+        self.session.update_stage("generating_lyrics")
+        candidates = self._generate_lyrics_candidates()
+        self.session.update_stage("reviewing_lyrics")
+
+        # 默认选中第一个候选，趁用户审核时在后台预热拼音标注
+        if candidates:
+            self._schedule_pinyin_annotation(candidates[0].content)
+
+        parts = [previous_response]
+        for lyrics in candidates:
+            parts.append(f"--- 版本 {lyrics.version} ---\n{lyrics.content}")
+        parts.append("如果满意请回复\"满意\"或\"开始生成\"，需要修改请直接说明您的意见。")
+
+        response = "\n\n".join(parts)
+        self.session.add_conversation_turn("assistant", response)
+        return response
+
     def reset_session(self):
         """重置会话状态"""
         self.session = MusicSessionState()
@@ -118,7 +380,7 @@ class InteractiveMusicAgent:
                 return self._handle_lyrics_review(user_message)
 
             elif current_stage == "generating_music":
-                return "音乐正在生成中，请稍候..."
+                return f"音乐正在生成中，当前进度约 {self.session.generation_progress:.0%}，请稍候..."
 
             elif current_stage == "completed":
                 return "音乐生成已完成！您可以查看和下载生成的音乐。"
@@ -134,49 +396,17 @@ class InteractiveMusicAgent:
         """处理初始消息，使用React式思维模式"""
         self.session.add_debug_log(f"Agent正在分析用户需求: {message}")
 
-        # 使用LLM进行React式分析
-        analysis_prompt = f"""
-作为一个音乐生成助手，我需要分析用户的需求并制定行动计划。
-
-用户输入: "{message}"
-
-我需要理解：
-1. 用户想要什么类型的音乐？
-2. 什么风格和情绪？
-3. 是否有特殊要求？
-
-让我分析一下：
-
-思考：用户说"{message}"
-"""
-
         try:
-            # 使用LLM分析用户需求
-            analysis_response = self.llm_client.call(analysis_prompt, max_tokens=300)
-            self.session.add_debug_log(f"LLM分析结果: {analysis_response[:100]}...")
-
-            # 智能提取关键信息
-            if "爱国" in message or "国家" in message or "祖国" in message:
-                style = "流行"
-                mood = "激昂"
-                theme = "爱国情怀"
-                analysis = "我理解您想要一首体现爱国情怀的音乐。这类音乐通常情感激昂，能够激发人们的爱国热情。"
-            elif "悲伤" in message or "难过" in message or "失恋" in message:
-                style = "民谣"
-                mood = "悲伤"
-                theme = "悲伤情感"
-                analysis = "我感受到您想要表达悲伤或失落的情感。民谣风格很适合传达这种深层的情感体验。"
-            elif "快乐" in message or "开心" in message or "庆祝" in message:
-                style = "流行"
-                mood = "快乐"
-                theme = "快乐庆祝"
-                analysis = "我听出您想要轻快愉悦的音乐！流行风格能很好地表达这种积极向上的情绪。"
+            # 一次线性扫描提取关键信息，命中关键词时无需LLM参与
+            match = _THEME_KEYWORD_PATTERN.search(message)
+            if match:
+                style, mood, theme, analysis = _THEME_KEYWORD_PROFILES[match.group()]
             else:
-                # 使用LLM智能分析
-                mood = self._extract_mood_from_theme(message)
+                # 未命中已知关键词，才请求LLM：一次结构化调用同时
+                # 拿到情绪和分析文案，不再为分析单独多打一次LLM
+                mood, analysis = self._extract_mood_from_theme(message)
                 style = "流行"  # 默认
                 theme = message
-                analysis = f"我正在分析您的需求：{message}。让我为您创作相应的音乐。"
 
             # 创建用户需求
             requirement = UserRequirement(
@@ -222,18 +452,8 @@ class InteractiveMusicAgent:
         if "满意" in message or "好的" in message or "可以" in message or "开始生成" in message:
             # 用户满意，开始生成音乐
             if self.session.lyrics_versions:
-                selected_lyrics = self.session.lyrics_versions[0]
-                self.session.selected_lyrics = selected_lyrics
-                self.session.update_stage("preparing_generation")
-
-                # 构建生成参数
-                params = self._build_generation_params(selected_lyrics)
-
-                # 开始音乐生成
-                self.session.update_stage("generating_music")
                 try:
-                    result = self._invoke_mcp(params)
-                    self.session.final_result = result
+                    self._commit_and_generate(self.session.lyrics_versions[0])
                     self.session.update_stage("completed")
 
                     return "太好了！音乐已经生成完成。您可以在右侧面板中试听和下载生成的音乐。"
@@ -257,103 +477,71 @@ class InteractiveMusicAgent:
                 )
                 self.session.lyrics_versions.append(new_version)
 
+                # 新版本落地即重新预热标注，覆盖旧future
+                self._schedule_pinyin_annotation(modified_lyrics)
+
                 response = f"根据您的反馈，我重新创作了歌词：\n\n{modified_lyrics}\n\n这个版本怎么样？"
                 self.session.add_conversation_turn("assistant", response)
                 return response
             else:
                 return "没有找到原始歌词，请重新开始。"
 
-    def _collect_user_requirements(self) -> UserRequirement:
-        """收集用户需求"""
-        print("\n🎵 欢迎使用 ACE 音乐生成助手！")
-        print("我将帮助您创作个性化的音乐作品。")
-
-        # 询问音乐主题和风格
-        theme = input("\\n请描述您想要的音乐主题或情感（如：失恋的悲伤、成功的喜悦、朋友间的温暖）: ").strip()
-        self.session.add_conversation_turn("user", f"音乐主题: {theme}")
-
-        # 询问具体风格偏好
-        style_prompt = """
-请选择或描述您喜欢的音乐风格：
-1. 说唱/Hip-hop（嘻哈、rap）
-2. 流行/Pop（流行歌曲）
-3. 摇滚/Rock（摇滚乐）
-4. 民谣/Folk（民间音乐）
-5. 电子/Electronic（电子音乐）
-6. 其他（请描述）
-
-您的选择: """
-        style_input = input(style_prompt).strip()
-        self.session.add_conversation_turn("user", f"风格选择: {style_input}")
-
-        # 解析风格
-        style = self._parse_style_input(style_input)
-
-        # 询问时长
-        duration_input = input(f"\\n音频时长（秒，默认{self.config.default_audio_duration}秒）: ").strip()
-        try:
-            duration = float(duration_input) if duration_input else self.config.default_audio_duration
-        except ValueError:
-            duration = self.config.default_audio_duration
-
-        # 询问特殊要求
-        special_requests = input("\\n有什么特殊要求吗？（如：要有吉他solo、节奏要快一些等，可选）: ").strip()
-        requests_list = [special_requests] if special_requests else []
-
-        # 使用LLM提取情绪
-        mood = self._extract_mood_from_theme(theme)
-
-        requirement = UserRequirement(
-            style=style,
-            mood=mood,
-            duration=duration,
-            language="中文",
-            specific_requests=requests_list,
-            theme=theme
-        )
+    def _commit_and_generate(self, lyrics: LyricsVersion) -> MusicGenerationResult:
+        """确认选中歌词并触发音乐生成（同一会话只生成一次）
 
-        self.session.add_debug_log(f"收集到用户需求: {requirement}")
-        return requirement
-
-    def _parse_style_input(self, style_input: str) -> str:
-        """解析用户的风格输入"""
-        style_input = style_input.lower()
-        if "1" in style_input or "说唱" in style_input or "rap" in style_input or "hip" in style_input:
-            return "说唱"
-        elif "2" in style_input or "流行" in style_input or "pop" in style_input:
-            return "流行"
-        elif "3" in style_input or "摇滚" in style_input or "rock" in style_input:
-            return "摇滚"
-        elif "4" in style_input or "民谣" in style_input or "folk" in style_input:
-            return "民谣"
-        elif "5" in style_input or "电子" in style_input or "electronic" in style_input:
-            return "电子"
-        else:
-            return style_input  # 用户自定义描述
+        CLI和Web两条入口都落到这里；会话里已有成功结果时直接
+        复用，不再为同一份歌词重复触发整段生成。
+        """
+        existing = self.session.final_result or self.session.generation_result
+        if existing and existing.success:
+            self.session.add_debug_log("会话已有成功的生成结果，跳过重复生成")
+            return existing
+
+        self.session.selected_lyrics = lyrics
+        lyrics.approved = True
+        self.session.update_stage("preparing_generation")
+
+        params = self._build_generation_params(lyrics)
+        self.session.generation_params = params
 
-    def _extract_mood_from_theme(self, theme: str) -> str:
-        """使用LLM从主题中提取情绪"""
+        self.session.update_stage("generating_music")
+        result = self._invoke_mcp(params)
+        self.session.generation_result = result
+        self.session.final_result = result
+        return result
+
+    def _extract_mood_from_theme(self, theme: str) -> Tuple[str, str]:
+        """使用LLM从主题中提取情绪和需求分析（单次结构化调用）"""
         prompt = f"""
-根据用户描述的音乐主题，提取出主要的情绪关键词。
+根据用户描述的音乐主题，提取主要情绪并给出一句需求分析。
 
 用户主题: {theme}
 
-请从以下情绪中选择最符合的1-2个，用逗号分隔：
+情绪请从以下中选择最符合的1-2个，用逗号分隔：
 悲伤, 愤怒, 快乐, 温柔, 激昂, 忧郁, 浪漫, 怀旧, 励志, 平静, 狂野, 梦幻
-
 如果以上都不合适，请直接用1-2个形容词概括情绪。
 
-情绪:"""
+请严格按JSON格式返回：
+{{"mood": "情绪关键词", "analysis": "一句话的需求分析，面向用户口吻"}}"""
 
+        fallback_analysis = f"我正在分析您的需求：{theme}。让我为您创作相应的音乐。"
         try:
             exchanges = [LLMExchange(role="user", content=prompt)]
-            response = self.llm_client.chat_completion(exchanges)
-            mood = response.strip()
-            self.session.add_debug_log(f"LLM提取的情绪: {mood}")
-            return mood
+            # 情绪提取是主题的纯函数，temperature=0时开启响应缓存，
+            # 重复主题（如"失恋"）直接命中磁盘而不是重新调用LLM；
+            # 辅助性调用继续走快速模型档位，不占主力模型配额
+            response = self.llm_client.chat_completion(
+                exchanges, temperature=0.0, cache=True,
+                model=self.config.fast_model
+            )
+            parsed = json.loads(_RE_CODE_FENCE_MARK.sub('', response).strip())
+            mood = str(parsed.get("mood", "")).strip() or "未知"
+            analysis = str(parsed.get("analysis", "")).strip() or fallback_analysis
+            self.session.add_debug_log(f"LLM提取的情绪: {mood}; 分析: {analysis}")
+            return mood, analysis
         except Exception as e:
             self.session.add_debug_log(f"情绪提取失败: {e}")
-            return "未知"
+            return "未知", fallback_analysis
 
     def _generate_lyrics_candidates(self) -> List[LyricsVersion]:
         """生成歌词候选"""
@@ -361,37 +549,68 @@ class InteractiveMusicAgent:
         if not requirement:
             raise ValueError("用户需求未收集")
 
-        print(f"\\n🎤 正在为您创作歌词...")
-        print(f"主题: {requirement.theme}")
-        print(f"风格: {requirement.style}")
-        print(f"情绪: {requirement.mood}")
+        self.log.info(f"🎤 正在为您创作歌词...")
+        self.log.info(f"主题: {requirement.theme}")
+        self.log.info(f"风格: {requirement.style}")
+        self.log.info(f"情绪: {requirement.mood}")
 
+        target_count = 2
         candidates = []
         retries = 0
+        attempt = 0
 
-        while len(candidates) < 2 and retries < self.config.max_lyrics_retries:
-            try:
-                lyrics_content = self._generate_single_lyrics(requirement, attempt=retries + 1)
-                lyrics = self.session.add_lyrics_version(lyrics_content)
-                candidates.append(lyrics)
-                self.session.add_debug_log(f"成功生成歌词版本 {lyrics.version}")
+        # 优先用一次n路采样拿到全部候选：同一个prompt只做一次prefill，
+        # 比并发发起多个独立请求更省token也更快
+        try:
+            responses = self.llm_client.chat_completion(
+                self._build_lyrics_messages(requirement), n=target_count
+            )
+        except Exception as e:
+            self.session.add_debug_log(f"多候选采样不可用，退回逐个生成: {e}")
+            responses = []
+
+        for response in responses:
+            if len(candidates) >= target_count:
+                break
+            lyrics_content = self._clean_lyrics_response(response)
+            if len(lyrics_content.strip()) < 20:
+                continue
+            lyrics = self.session.add_lyrics_version(lyrics_content)
+            candidates.append(lyrics)
+            self.session.add_debug_log(f"成功生成歌词版本 {lyrics.version}")
+
+        # 兜底路径：n路采样失败或候选不足时，并发补齐缺口，
+        # 失败的槽位在下一轮重试，而不是串行逐个生成
+        while len(candidates) < target_count and retries <= self.config.max_lyrics_retries:
+            missing = target_count - len(candidates)
+            with ThreadPoolExecutor(max_workers=missing) as pool:
+                futures = []
+                for _ in range(missing):
+                    attempt += 1
+                    futures.append(pool.submit(self._generate_single_lyrics, requirement, attempt))
+
+                failed = 0
+                for future in futures:
+                    try:
+                        lyrics_content = future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.session.add_debug_log(f"歌词生成失败 (尝试 {attempt}): {e}")
+                    else:
+                        lyrics = self.session.add_lyrics_version(lyrics_content)
+                        candidates.append(lyrics)
+                        self.session.add_debug_log(f"成功生成歌词版本 {lyrics.version}")
 
-            except Exception as e:
+            if failed:
                 retries += 1
-                self.session.add_debug_log(f"歌词生成失败 (尝试 {retries}): {e}")
                 if retries >= self.config.max_lyrics_retries:
                     raise Exception(f"歌词生成多次失败，已达到最大重试次数 ({self.config.max_lyrics_retries})")
 
         return candidates
 
-    def _generate_single_lyrics(self, requirement: UserRequirement, attempt: int = 1) -> str:
-        """生成单个歌词"""
-        style_guidance = self._get_style_guidance(requirement.style)
-
-        prompt = f"""
-你是一位专业的中文歌词创作人。请根据用户需求创作一首歌词。
-
-用户需求:
+    def _build_lyrics_messages(self, requirement: UserRequirement) -> List[LLMExchange]:
+        """构建歌词创作消息：稳定的system前缀 + 按需求变化的user后缀"""
+        user_prompt = f"""用户需求:
 - 主题: {requirement.theme}
 - 风格: {requirement.style}
 - 情绪: {requirement.mood}
@@ -399,24 +618,38 @@ class InteractiveMusicAgent:
 - 特殊要求: {', '.join(requirement.specific_requests) if requirement.specific_requests else '无'}
 
 风格指导:
-{style_guidance}
-
-创作要求:
-1. 歌词要有真实的情感表达，贴近主题
-2. 语言要生动有力，有画面感
-3. 节奏要符合{requirement.style}风格
-4. 考虑到{requirement.duration}秒的时长，控制歌词长度
-5. 避免使用过于复杂或生僻的词汇
-6. 要有层次感，包含主歌、副歌等结构
+{self._get_style_guidance(requirement.style)}"""
 
-请直接输出歌词内容，不要加其他说明:"""
+        return [
+            LLMExchange(role="system", content=_LYRICS_SYSTEM_PROMPT),
+            LLMExchange(role="user", content=user_prompt),
+        ]
 
+    def _generate_single_lyrics(self, requirement: UserRequirement, attempt: int = 1) -> str:
+        """生成单个歌词（流式消费，劣质输出提前中止）"""
         try:
-            exchanges = [LLMExchange(role="user", content=prompt)]
-            response = self.llm_client.chat_completion(exchanges)
+            stream = self.llm_client.chat_completion_stream(
+                self._build_lyrics_messages(requirement)
+            )
+            parts: List[str] = []
+            received = 0
+            quality_checked = False
+            for delta in stream:
+                if not parts:
+                    self.session.add_debug_log(f"歌词流式响应首包到达 (尝试 {attempt})")
+                parts.append(delta)
+                received += len(delta)
+
+                # 已经收了一段内容但清理后仍没有实质歌词（如模型在
+                # 闲聊或围栏里打转），提前断开，省掉剩余token
+                if not quality_checked and received >= 400:
+                    quality_checked = True
+                    if len(self._clean_lyrics_response("".join(parts)).strip()) < 20:
+                        stream.close()
+                        raise ValueError("流式输出未出现有效歌词内容，已提前中止")
 
             # 清理响应内容
-            lyrics = self._clean_lyrics_response(response)
+            lyrics = self._clean_lyrics_response("".join(parts))
 
             if len(lyrics.strip()) < 20:
                 raise ValueError("生成的歌词过短")
@@ -428,116 +661,30 @@ class InteractiveMusicAgent:
 
     def _get_style_guidance(self, style: str) -> str:
         """获取风格指导"""
-        style_guides = {
-            "说唱": "节奏感强，韵脚明显，可以有一些街头文化元素，语言可以更直接有力",
-            "流行": "朗朗上口，易于传唱，情感表达要真挚自然，有一定的流行元素",
-            "摇滚": "有力量感，可以有一些叛逆或激情的元素，语言要有冲击力",
-            "民谣": "质朴自然，有故事性，语言要温暖真实，贴近生活",
-            "电子": "现代感强，可以有一些科技或未来元素，节奏要明快"
-        }
-        return style_guides.get(style, "保持音乐风格的特色，语言要有感染力")
+        return _style_guidance_for(style)
 
     def _clean_lyrics_response(self, response: str) -> str:
         """清理LLM返回的歌词"""
         # 移除常见的标记和格式
-        response = re.sub(r'^歌词[:：]?\\s*', '', response.strip())
-        response = re.sub(r'^[【\\[].*?[】\\]]\\s*', '', response)
-        response = re.sub(r'```.*?```', '', response, flags=re.DOTALL)
+        response = _RE_LYRICS_PREFIX.sub('', response.strip())
+        response = _RE_BRACKET_HEADER.sub('', response)
+        response = _RE_CODE_FENCE.sub('', response)
 
         return response.strip()
 
-    def _review_with_user(self, candidates: List[LyricsVersion]) -> LyricsVersion:
-        """用户确认歌词"""
-        print("\\n📝 歌词创作完成！请查看以下版本:")
-
-        for lyrics in candidates:
-            print(f"\\n--- 版本 {lyrics.version} ---")
-            print(lyrics.content)
-            print("-" * 40)
-
-        # 自动确认逻辑
-        if len(candidates) == 1 and self.config.auto_approve_single_lyrics:
-            selected = candidates[0]
-            selected.approved = True
-            self.session.selected_lyrics = selected
-            print(f"\\n✅ 自动选择版本 {selected.version}")
-            return selected
-
-        # 用户选择
-        retry_count = 0
-        max_retries = self.config.max_lyrics_retries
-
-        while retry_count < max_retries:
-            choice = input(f"\\n请选择您喜欢的版本 (1-{len(candidates)})，或输入 'r' 重新生成: ").strip().lower()
-
-            if choice == 'r':
-                print(f"\\n🔄 正在重新生成歌词... (剩余重试次数: {max_retries - retry_count - 1})")
-                try:
-                    new_candidates = self._generate_lyrics_candidates()
-                    return self._review_with_user(new_candidates)
-                except Exception as e:
-                    retry_count += 1
-                    print(f"❌ 重新生成失败: {e}")
-                    if retry_count >= max_retries:
-                        print(f"💥 已达到最大重试次数 ({max_retries})，请从现有版本中选择")
-                        break
-                    continue
-
-            try:
-                version = int(choice)
-                if 1 <= version <= len(candidates):
-                    selected = candidates[version - 1]
-
-                    # 询问是否需要修改
-                    modify = input(f"\\n选择了版本 {version}。需要修改吗？(y/n): ").strip().lower()
-                    if modify == 'y':
-                        feedback = input("请描述您希望如何修改: ").strip()
-                        selected.user_feedback = feedback
-
-                        # 基于反馈修改歌词
-                        try:
-                            modified_lyrics = self._modify_lyrics_based_on_feedback(selected.content, feedback)
-                            modified_version = self.session.add_lyrics_version(modified_lyrics)
-                            modified_version.user_feedback = f"基于版本{version}修改: {feedback}"
-                            selected = modified_version
-                            print(f"\\n✏️  已生成修改版本 {selected.version}")
-                        except Exception as e:
-                            print(f"⚠️  修改失败: {e}")
-                            print("使用原版本继续")
-
-                    selected.approved = True
-                    self.session.selected_lyrics = selected
-                    print(f"\\n✅ 已确认选择版本 {selected.version}")
-                    return selected
-                else:
-                    print(f"请输入 1-{len(candidates)} 之间的数字")
-            except ValueError:
-                print("请输入有效的选项")
-
-        # 如果达到最大重试次数，强制选择第一个版本
-        selected = candidates[0]
-        selected.approved = True
-        self.session.selected_lyrics = selected
-        print(f"\\n⚠️  自动选择版本 {selected.version}")
-        return selected
-
     def _modify_lyrics_based_on_feedback(self, original_lyrics: str, feedback: str) -> str:
         """基于用户反馈修改歌词"""
-        prompt = f"""
-用户对以下歌词提出了修改意见，请根据反馈进行调整：
-
-原歌词:
+        user_prompt = f"""原歌词:
 {original_lyrics}
 
 用户反馈:
-{feedback}
-
-请根据用户的反馈对歌词进行适当修改，保持歌词的整体结构和韵律，但要满足用户的要求。
-
-修改后的歌词:"""
+{feedback}"""
 
         try:
-            exchanges = [LLMExchange(role="user", content=prompt)]
+            exchanges = [
+                LLMExchange(role="system", content=_LYRICS_REVISE_SYSTEM_PROMPT),
+                LLMExchange(role="user", content=user_prompt),
+            ]
             response = self.llm_client.chat_completion(exchanges)
             modified = self._clean_lyrics_response(response)
 
@@ -558,9 +705,12 @@ class InteractiveMusicAgent:
         # 生成英文prompt
         english_prompt = self._generate_english_prompt(requirement)
 
+        # 🔥 修复：生成用的歌词必须先过拼音标注，否则多音字读音不对
+        prepared_lyrics = self._prepare_lyrics_for_generation(lyrics)
+
         params = GenerationParams(
             prompt=english_prompt,
-            lyrics=lyrics.content,
+            lyrics=prepared_lyrics,
             audio_duration=requirement.duration,
             candidate_count=self.config.default_candidate_count
         )
@@ -572,185 +722,136 @@ class InteractiveMusicAgent:
         return params
 
     def _generate_english_prompt(self, requirement: UserRequirement) -> str:
-        """生成英文技术描述prompt"""
-        style_prompts = {
-            "说唱": "Rap, hip-hop, rhythmic, urban, strong beat",
-            "流行": "Pop, mainstream, catchy, melodic, contemporary",
-            "摇滚": "Rock, energetic, guitar-driven, powerful, dynamic",
-            "民谣": "Folk, acoustic, natural, storytelling, gentle",
-            "电子": "Electronic, synthesized, digital, modern, pulsing"
-        }
-
-        mood_prompts = {
-            "悲伤": "melancholic, sad, emotional, slow tempo",
-            "愤怒": "angry, aggressive, intense, heavy",
-            "快乐": "happy, upbeat, joyful, lively",
-            "温柔": "gentle, soft, warm, tender",
-            "激昂": "energetic, passionate, powerful, uplifting",
-            "忧郁": "melancholic, moody, introspective, dark",
-            "浪漫": "romantic, loving, intimate, sweet",
-            "怀旧": "nostalgic, reminiscent, wistful, vintage",
-            "励志": "inspiring, motivational, uplifting, hopeful",
-            "平静": "calm, peaceful, serene, relaxed"
-        }
-
-        style_desc = style_prompts.get(requirement.style, requirement.style)
-
-        # 处理复合情绪（如："激昂, 励志"）
-        mood_parts = []
-        if requirement.mood:
-            mood_keywords = [m.strip() for m in requirement.mood.split(',')]
-            for mood in mood_keywords:
-                english_mood = mood_prompts.get(mood.strip(), "")
-                if english_mood:
-                    mood_parts.append(english_mood)
-
-        mood_desc = ", ".join(mood_parts) if mood_parts else "emotional"
-
-        # 组合prompt
-        prompt_parts = [style_desc, mood_desc, "Chinese male vocals", "clear vocals"]
-
-        # 处理特殊要求 - 转换为英文
-        if requirement.specific_requests:
-            english_requests = self._translate_special_requests(requirement.specific_requests)
-            prompt_parts.extend(english_requests)
-
-        return ", ".join(prompt_parts)
+        """生成英文技术描述prompt
+
+        纯函数：相同的(风格, 情绪, 特殊要求)直接命中缓存，
+        MCP重试等重复进入不再重算。
+        """
+        return _english_prompt_for(
+            requirement.style,
+            requirement.mood or "",
+            tuple(requirement.specific_requests or ())
+        )
 
     def _translate_special_requests(self, requests: List[str]) -> List[str]:
         """将中文特殊要求转换为英文"""
-        translation_map = {
-            "希望感情很厚重": "deep emotional, rich feeling, intense",
-            "要有吉他solo": "guitar solo, guitar lead",
-            "节奏要快一些": "fast tempo, upbeat rhythm",
-            "节奏要慢一些": "slow tempo, gentle rhythm",
-            "要有电子音效": "electronic effects, synthesizer",
-            "声音要清澈": "clear vocals, crisp sound",
-            "要有和声": "harmony, backing vocals",
-            "要有说唱部分": "rap section, hip-hop elements"
-        }
-
-        english_requests = []
-        for request in requests:
-            # 直接映射
-            if request in translation_map:
-                english_requests.append(translation_map[request])
-            # 关键词匹配
-            elif "吉他" in request or "guitar" in request.lower():
-                english_requests.append("guitar elements")
-            elif "节奏快" in request or "快节奏" in request:
-                english_requests.append("fast tempo")
-            elif "节奏慢" in request or "慢节奏" in request:
-                english_requests.append("slow tempo")
-            elif "厚重" in request or "深沉" in request:
-                english_requests.append("deep, rich")
-            elif "清澈" in request or "清晰" in request:
-                english_requests.append("clear, crisp")
-            elif "电子" in request:
-                english_requests.append("electronic")
-            else:
-                # 对于无法识别的要求，使用通用描述
-                english_requests.append("expressive")
-
-        return english_requests
+        return _translate_requests(tuple(requests))
 
     def _adjust_guidance_schedule(self, style: str) -> List[Dict[str, float]]:
         """根据风格调整guidance调度"""
-        # 基础调度
-        base_schedule = [
-            {"position": 0.0, "scale": 10.0},
-            {"position": 0.4, "scale": 16.0},
-            {"position": 0.8, "scale": 12.0},
-            {"position": 1.0, "scale": 8.0}
+        # 缓存的是不可变节点元组，这里转成新的dict列表返回，
+        # 避免调用方改动参数时互相串扰
+        return [
+            {"position": position, "scale": scale}
+            for position, scale in _guidance_schedule_for(style)
         ]
 
-        # 根据风格微调
-        if style == "说唱":
-            # 说唱需要更强的节奏控制
-            return [
-                {"position": 0.0, "scale": 12.0},
-                {"position": 0.3, "scale": 18.0},
-                {"position": 0.7, "scale": 15.0},
-                {"position": 1.0, "scale": 10.0}
-            ]
-        elif style == "摇滚":
-            # 摇滚需要更强的动态变化
-            return [
-                {"position": 0.0, "scale": 8.0},
-                {"position": 0.2, "scale": 20.0},
-                {"position": 0.8, "scale": 16.0},
-                {"position": 1.0, "scale": 6.0}
-            ]
-
-        return base_schedule
+    def _schedule_pinyin_annotation(self, lyrics_content: str):
+        """后台预热拼音标注，让计算与用户的审核决策重叠"""
+        if not self.config.enable_pinyin_annotation:
+            return
+        self._pinyin_source = lyrics_content
+        self._pinyin_future = self._pool.submit(annotate_with_stats, lyrics_content)
+
+    def _resolve_pinyin_annotation(self, lyrics_content: str) -> Tuple[str, Dict]:
+        """取回预热的标注结果，未预热或歌词已变化时现场计算"""
+        future = self._pinyin_future
+        if future is not None and self._pinyin_source == lyrics_content:
+            try:
+                return future.result()
+            except Exception as e:
+                self.session.add_debug_log(f"后台拼音标注失败，改为同步计算: {e}")
+        return annotate_with_stats(lyrics_content)
 
     def _prepare_lyrics_for_generation(self, lyrics: LyricsVersion) -> str:
-        """为生成准备歌词（包括拼音标注等）"""
+        """为生成准备歌词（包括拼音标注等）
+
+        CLI和Web路径都会走到这里，因此不做任何stdin交互：
+        有多音字标注时直接采用标注版本，标注后的歌词和统计
+        挂回LyricsVersion供UI层展示。
+        """
         if self.config.enable_pinyin_annotation:
             try:
-                print("🔤 正在为歌词添加拼音标注...")
+                self.log.info("🔤 正在为歌词添加拼音标注...")
 
-                # 获取多音字统计
-                stats = get_polyphonic_stats(lyrics.content)
-                if stats:
-                    print(f"   发现 {len(stats)} 个多音字需要标注")
-                    for char, positions in stats.items():
-                        print(f"   - '{char}': {len(positions)}次")
-
-                # 添加拼音标注
-                annotated = annotate_polyphonic_lyrics(lyrics.content)
+                # 标注和统计在进入审核阶段时已提交后台计算，
+                # 这里通常直接取结果，不再同步扫两遍歌词
+                annotated, stats = self._resolve_pinyin_annotation(lyrics.content)
                 lyrics.pinyin_annotated = annotated
+                lyrics.polyphonic_stats = stats  # 供UI层直接渲染，免二次扫描
 
-                # 显示标注结果
-                if annotated != lyrics.content:
-                    print("✅ 拼音标注完成")
-                    self.session.add_debug_log("已添加拼音标注")
-
-                    # 询问用户是否查看标注结果
-                    show_annotated = input("\\n是否查看标注后的歌词？(y/n): ").strip().lower()
-                    if show_annotated == 'y':
-                        print("\\n📝 标注后的歌词:")
-                        print("-" * 40)
-                        print(annotated)
-                        print("-" * 40)
-
-                        # 询问是否使用标注版本
-                        use_annotated = input("\\n是否使用标注版本进行生成？(y/n): ").strip().lower()
-                        if use_annotated == 'y':
-                            self.session.add_debug_log("使用拼音标注版本")
-                            return annotated
-                        else:
-                            self.session.add_debug_log("使用原始歌词版本")
-                else:
-                    print("ℹ️  未发现需要标注的多音字")
+                # 没有多音字（或标注没有任何改动）时直接走原文
+                if not stats or annotated == lyrics.content:
+                    self.log.info("ℹ️  未发现需要标注的多音字")
+                    return lyrics.content
+
+                self.log.info(f"   发现 {len(stats)} 个多音字需要标注")
+                for char, positions in stats.items():
+                    self.log.info(f"   - '{char}': {len(positions)}次")
+
+                self.log.info("✅ 拼音标注完成")
+                self.session.add_debug_log("使用拼音标注版本")
+                return annotated
 
             except Exception as e:
                 error_msg = f"拼音标注失败: {e}"
                 self.session.add_debug_log(error_msg)
-                print(f"⚠️  {error_msg}")
+                self.log.info(f"⚠️  {error_msg}")
 
         return lyrics.content
 
+    @staticmethod
+    def _retry_delay(retry_count: int, base: float = 2.0, max_backoff: float = 30.0) -> float:
+        """指数退避+抖动的重试间隔
+
+        固定的3秒/5秒间隔会让并发会话的重试同步撞向MCP服务；
+        抖动把重试时间打散，指数退避则在服务持续不可用时快速让路。
+        """
+        return min(max_backoff, base * (2 ** retry_count)) * (0.5 + random.random())
+
+    @staticmethod
+    def _generation_cache_key(params: GenerationParams) -> str:
+        """GenerationParams的内容寻址键（字段序稳定）"""
+        payload = json.dumps(dataclasses.asdict(params), sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode("utf-8")).hexdigest()
+
     def _invoke_mcp(self, params: GenerationParams) -> MusicGenerationResult:
         """调用MCP服务生成音乐"""
         start_time = time.time()
 
+        # 完全相同的参数这轮会话已经成功生成过，直接返回之前的
+        # 结果（整段音频生成时间坍缩为一次字典查询）
+        cache_key = self._generation_cache_key(params)
+        cached = self._generation_cache.get(cache_key)
+        if cached is not None:
+            self.log.info("🎯 参数未变化，复用本次会话已生成的结果")
+            self.session.add_debug_log(f"生成结果缓存命中: {cache_key[:16]}")
+            self.session.generation_progress = 1.0
+            return dataclasses.replace(
+                cached, metadata={**cached.metadata, "cache_hit": True}
+            )
+
         max_retries = self.config.max_generation_retries
         retry_count = 0
 
         while retry_count <= max_retries:
             try:
                 if retry_count > 0:
-                    print(f"\\n🔄 正在重试音乐生成... (第{retry_count}/{max_retries}次重试)")
+                    self.log.info(f"🔄 正在重试音乐生成... (第{retry_count}/{max_retries}次重试)")
                 else:
-                    print(f"\\n🎵 正在生成音乐...")
+                    self.log.info(f"🎵 正在生成音乐...")
 
-                print(f"参数: {params.prompt}")
-                print(f"时长: {params.audio_duration}秒")
-                print(f"候选数: {params.candidate_count}")
+                self.log.info(f"参数: {params.prompt}")
+                self.log.info(f"时长: {params.audio_duration}秒")
+                self.log.info(f"候选数: {params.candidate_count}")
 
                 # 调用MCP客户端 - 🔥 传递所有配置参数
-                result = self.mcp_client.generate_music(
+                # 走流式接口，等待期间持续更新会话中的进度估算，
+                # 让process_user_input的轮询能拿到真实进展
+                estimated_total = max(30.0, params.audio_duration * 2)
+                result = None
+                self.session.generation_progress = 0.0
+                for kind, payload in self.mcp_client.generate_music_streaming(
                     prompt=params.prompt,
                     lyrics=params.lyrics,
                     audio_duration=params.audio_duration,
@@ -758,39 +859,47 @@ class InteractiveMusicAgent:
                     guidance_schedule=params.guidance_schedule,
                     lora_config=params.lora_config,  # 🔥 添加LoRA配置
                     cache_settings=params.cache_settings  # 🔥 添加缓存设置
-                )
+                ):
+                    if kind == "progress":
+                        self.session.generation_progress = min(payload / estimated_total, 0.95)
+                    else:
+                        result = payload
+                self.session.generation_progress = 1.0 if result and result.success else 0.0
 
                 generation_time = time.time() - start_time
                 result.generation_time = generation_time
 
                 if result.success:
-                    print(f"\\n✅ 音乐生成成功！")
-                    print(f"生成时间: {generation_time:.1f}秒")
-                    print(f"输出文件: {', '.join(result.audio_paths)}")
+                    self.log.info(f"✅ 音乐生成成功！")
+                    self.log.info(f"生成时间: {generation_time:.1f}秒")
+                    self.log.info(f"输出文件: {', '.join(result.audio_paths)}")
 
                     # 记录成功的元数据
                     if result.metadata:
                         metadata = result.metadata
                         if metadata.get("cache_hit"):
-                            print("🎯 缓存命中")
+                            self.log.info("🎯 缓存命中")
 
                         evaluation_scores = metadata.get("evaluation_scores", {})
                         if evaluation_scores:
                             overall_score = evaluation_scores.get("overall_score", 0)
-                            print(f"⭐ 评估分数: {overall_score:.1f}/10.0")
+                            self.log.info(f"⭐ 评估分数: {overall_score:.1f}/10.0")
 
+                    # 成功结果写入内容寻址缓存，供相同参数的重复提交复用
+                    self._generation_cache[cache_key] = result
                     return result
                 else:
                     error_msg = result.error or "未知错误"
-                    print(f"\\n❌ 音乐生成失败: {error_msg}")
+                    self.log.info(f"❌ 音乐生成失败: {error_msg}")
 
                     if retry_count < max_retries:
-                        print(f"将在3秒后重试...")
-                        time.sleep(3)
+                        delay = self._retry_delay(retry_count)
+                        self.log.info(f"将在{delay:.1f}秒后重试...")
+                        time.sleep(delay)
                         retry_count += 1
                         continue
                     else:
-                        print(f"💥 已达到最大重试次数 ({max_retries})")
+                        self.log.info(f"💥 已达到最大重试次数 ({max_retries})")
                         generation_time = time.time() - start_time
                         result.generation_time = generation_time
                         return result
@@ -798,15 +907,16 @@ class InteractiveMusicAgent:
             except Exception as e:
                 generation_time = time.time() - start_time
                 error_msg = f"MCP调用异常: {str(e)}"
-                print(f"\\n💥 {error_msg}")
+                self.log.info(f"💥 {error_msg}")
 
                 if retry_count < max_retries:
-                    print(f"将在5秒后重试...")
-                    time.sleep(5)
+                    delay = self._retry_delay(retry_count)
+                    self.log.info(f"将在{delay:.1f}秒后重试...")
+                    time.sleep(delay)
                     retry_count += 1
                     continue
                 else:
-                    print(f"💥 已达到最大重试次数 ({max_retries})")
+                    self.log.info(f"💥 已达到最大重试次数 ({max_retries})")
                     self.session.add_debug_log(error_msg)
 
                     return MusicGenerationResult(
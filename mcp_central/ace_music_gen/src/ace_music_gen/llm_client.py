@@ -1,8 +1,171 @@
 """LLM客户端模块，用于与大语言模型交互"""
 
-import json
+import asyncio
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, Iterator, List, Union, Optional
+
+import orjson
 import requests
-from typing import Dict, List, Union, Optional
+
+from .http_pool import get_session
+
+
+# 备用解析用的提取正则：一趟search替代逐行状态机
+_PROMPT_RE = re.compile(r'"?prompt"?\s*:\s*"?([^"\n]*)', re.I)
+_LYRICS_JSON_RE = re.compile(r'"?lyrics"?\s*:\s*"((?:[^"\\]|\\.)*)"', re.I | re.S)
+_LYRICS_TEXT_RE = re.compile(r'"?lyrics"?\s*:\s*(.*?)(?=\n\s*}|\Z)', re.I | re.S)
+
+
+
+# 备用内容常量：三份固定的fallback字典和关键词表在导入时建好，
+# 每次调用不再重新分配同样的字符串和字典对象
+_SAD_WORDS = frozenset(['伤感', '悲伤', '难过', '失落'])
+_ENERGETIC_WORDS = frozenset(['激昂', '热血', '激情', '燃'])
+
+_FALLBACK_SAD = {
+    "prompt": "Rap, adult, male, emotional, melancholic, slow tempo, introspective, clear vocals",
+    "lyrics": """[Intro]
+夜深了，思绪又开始泛滥
+这些年的得失，在心里翻转
+
+[Verse]
+走过这么多路，回头看那些伤
+有些痛不会忘，像刻在心上的疤
+曾经以为时间会带走所有难过
+现在才发现，有些记忆越久越深刻
+
+[Chorus]
+伤感不是软弱，是成长的代价
+每一次跌倒，都让我更懂得珍惜
+虽然心会痛，但我还在这里
+用音乐诉说，那些说不出的话
+
+[Outro]
+伤感也是一种美
+让我学会了更深的体会"""
+}
+
+_FALLBACK_ENERGETIC = {
+    "prompt": "Rap, energetic, powerful, fast tempo, aggressive, clear, motivational",
+    "lyrics": """[Intro]
+点燃心中的火焰
+这一刻，全世界都听见我的声音
+
+[Verse]
+不服输的心永远年轻
+每一次挑战都让我更加坚定
+汗水是我最好的证明
+成功的路上从不缺少拼搏的身影
+
+[Chorus]
+热血在沸腾，梦想在召唤
+没有什么能阻挡我前进的步伐
+燃烧吧青春，释放吧力量
+这是属于我们的时代
+
+[Outro]
+永不熄灭的火
+照亮前行的路"""
+}
+
+_FALLBACK_DEFAULT = {
+    "prompt": "Rap, adult, male, spoken word, moderate tempo, clear, versatile",
+    "lyrics": """[Intro]
+这是我的声音，这是我的故事
+
+[Verse]
+生活就像一场说唱
+有高有低，有快有慢
+重要的是保持自己的节拍
+在这个世界上留下属于自己的印记
+
+[Chorus]
+用音乐表达内心的想法
+让每一个音符都有灵魂
+这就是说唱的魅力
+真实而有力量
+
+[Outro]
+音乐永不停息
+我们的故事还在继续"""
+}
+
+
+class LLMResponseCache:
+    """LLM响应磁盘缓存
+
+    以(messages, model, temperature)的哈希为键，把LLM响应持久化到
+    sqlite。相同输入的调用（如重复主题的情绪提取）直接命中磁盘，
+    省掉一次完整的LLM往返。
+    """
+
+    def __init__(
+        self,
+        cache_path: str = "./.mcp_cache/llm_responses.sqlite3",
+        ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self._conn = None
+        self._lock = Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, content TEXT, created_at REAL)"
+            )
+        return self._conn
+
+    @staticmethod
+    def make_key(messages: List[Dict], model: str, temperature: float) -> str:
+        payload = orjson.dumps(
+            {"messages": messages, "model": model, "temperature": temperature},
+            option=orjson.OPT_SORT_KEYS,
+        )
+        return hashlib.blake2b(payload).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，未命中或已过期时返回None"""
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if not row:
+                    return None
+                content, created_at = row
+                if time.time() - created_at > self.ttl_seconds:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                return content
+            except sqlite3.Error:
+                return None
+
+    def put(self, key: str, content: str):
+        """写入缓存，失败时静默跳过"""
+        with self._lock:
+            try:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                    (key, content, time.time()),
+                )
+                conn.commit()
+            except sqlite3.Error:
+                pass
 
 
 class LLMClient:
@@ -12,57 +175,140 @@ class LLMClient:
         self.api_key = api_key
         self.base_url = base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
         self.model = model or "qwen-turbo-latest"
+        self.response_cache = LLMResponseCache()
+
+        # 复用进程级共享连接池的Session：keep-alive省掉每次调用的
+        # TCP+TLS握手（情绪提取这类小请求的延迟大头），且与MCP
+        # 客户端共享同一个urllib3池
+        self._http = get_session()
+
+        # 公共请求头挂到Session上，不必每次调用重建headers字典
+        self._http.headers.update({"Content-Type": "application/json"})
+
+        # 音乐参数生成的固定载荷骨架，每次调用只补messages，
+        # 免去重复构造相同的model/temperature/max_tokens字典
+        self._params_payload_template = {
+            "model": self.model,
+            "temperature": 0.8,
+            "max_tokens": 1500,
+        }
+        if self.api_key:
+            self._http.headers["Authorization"] = f"Bearer {self.api_key}"
+
+    def ping(self):
+        """预热到LLM服务的连接（只做握手，不消耗token），失败静默"""
+        try:
+            self._http.head(self.base_url, timeout=5)
+        except requests.exceptions.RequestException:
+            pass
 
     def setup_api(self, api_key: str):
         """设置API密钥"""
         self.api_key = api_key
+        self._http.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _post_with_retry(self, data: Dict, stream: bool = False) -> requests.Response:
+        """发送LLM请求，对瞬时故障做带抖动的指数退避重试
+
+        超时、连接失败以及429/503限流响应各重试最多2次；
+        限流响应如带Retry-After则优先按服务端给的时间等待。
+        其他错误照常抛出，由调用方的现有兜底逻辑处理。
+        """
+        body = orjson.dumps(data)
+        last_error = None
+        for attempt in range(3):
+            if attempt:
+                delay = min(8.0, 2.0 ** attempt) * (0.5 + random.random())
+                if last_error is not None and isinstance(last_error, requests.Response):
+                    retry_after = last_error.headers.get("Retry-After")
+                    if retry_after and retry_after.isdigit():
+                        delay = float(retry_after)
+                time.sleep(delay)
+            try:
+                response = self._http.post(
+                    self.base_url, data=body, timeout=30, stream=stream
+                )
+            except (requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError) as e:
+                last_error = e
+                continue
+            if response.status_code in (429, 503):
+                last_error = response
+                response.close()
+                continue
+            return response
+        if isinstance(last_error, requests.Response):
+            last_error.raise_for_status()
+        raise last_error
+
+    @staticmethod
+    def _format_messages(messages: Union[List[Dict], List['LLMExchange']]) -> List[Dict]:
+        """把LLMExchange对象或普通字典统一成API消息格式"""
+        formatted_messages = []
+        for msg in messages:
+            if hasattr(msg, 'to_dict'):  # LLMExchange对象
+                formatted_messages.append(msg.to_dict())
+            else:  # 普通字典
+                formatted_messages.append(msg)
+        return formatted_messages
 
     def chat_completion(
         self,
         messages: Union[List[Dict], List['LLMExchange']],
         temperature: float = 0.7,
-        max_tokens: int = 2000
-    ) -> str:
+        max_tokens: int = 2000,
+        cache: bool = False,
+        model: Optional[str] = None,
+        n: int = 1
+    ) -> Union[str, List[str]]:
         """通用的聊天补全接口
 
         Args:
             messages: 消息列表，可以是Dict格式或LLMExchange对象
             temperature: 温度参数
             max_tokens: 最大token数
+            cache: 是否启用响应缓存（只建议对temperature=0的确定性调用开启）
+            model: 覆盖默认模型（如把辅助性调用路由到更快的模型档位）
+            n: 采样候选数。n=1返回单个字符串；n>1时同一个prompt只计费
+               一次prefill，返回所有候选组成的列表
 
         Returns:
-            LLM的响应内容
+            n=1时为LLM的响应内容，n>1时为响应内容列表
         """
         if not self.api_key:
             raise ValueError("API密钥未设置，请先调用setup_api()或在构造函数中提供api_key")
 
-        # 转换消息格式
-        formatted_messages = []
-        for msg in messages:
-            if hasattr(msg, 'to_dict'):  # LLMExchange对象
-                formatted_messages.append(msg.to_dict())
-            else:  # 普通字典
-                formatted_messages.append(msg)
+        formatted_messages = self._format_messages(messages)
+        active_model = model or self.model
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        cache_key = None
+        if cache and n == 1:  # 多候选采样本身就要求多样性，不走缓存
+            cache_key = self.response_cache.make_key(formatted_messages, active_model, temperature)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
 
         data = {
-            "model": self.model,
+            "model": active_model,
             "messages": formatted_messages,
             "temperature": temperature,
             "max_tokens": max_tokens
         }
+        if n > 1:
+            data["n"] = n
 
         try:
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=30)
+            response = self._post_with_retry(data)
             response.raise_for_status()
 
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            return content.strip()
+            result = orjson.loads(response.content)
+            contents = [choice["message"]["content"].strip() for choice in result["choices"]]
+            if n > 1:
+                return contents
+            content = contents[0]
+            if cache_key is not None:
+                self.response_cache.put(cache_key, content)
+            return content
 
         except requests.exceptions.RequestException as e:
             raise Exception(f"API请求失败: {str(e)}")
@@ -71,7 +317,99 @@ class LLMClient:
         except Exception as e:
             raise Exception(f"LLM调用失败: {str(e)}")
 
-    def generate_music_params(self, user_idea: str) -> Dict[str, str]:
+    def chat_completion_stream(
+        self,
+        messages: Union[List[Dict], List['LLMExchange']],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        model: Optional[str] = None
+    ) -> Iterator[str]:
+        """流式聊天补全，逐段yield增量内容
+
+        调用方拿到首包即可开始处理，也可以在内容明显不对时提前
+        close()生成器中断连接，省掉剩余token的生成。
+        """
+        if not self.api_key:
+            raise ValueError("API密钥未设置，请先调用setup_api()或在构造函数中提供api_key")
+
+        data = {
+            "model": model or self.model,
+            "messages": self._format_messages(messages),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+
+        try:
+            response = self._post_with_retry(data, stream=True)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"API请求失败: {str(e)}")
+
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                try:
+                    chunk = orjson.loads(payload)
+                    delta = chunk["choices"][0].get("delta", {})
+                except (orjson.JSONDecodeError, KeyError, IndexError):
+                    continue
+                content = delta.get("content")
+                if content:
+                    yield content
+        finally:
+            response.close()
+
+    def call(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        model: Optional[str] = None,
+        cache: bool = False
+    ) -> str:
+        """单条用户消息的便捷调用入口"""
+        return self.chat_completion(
+            [{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            cache=cache,
+            model=model,
+        )
+
+    # ------------------------------------------------------------------
+    # 异步入口：阻塞的HTTP调用放到线程池执行，多个调用的网络RTT
+    # 和服务端推理时间相互重叠，事件循环本身不被卡住
+    # ------------------------------------------------------------------
+    async def agenerate_music_params(self, user_idea: str) -> Dict[str, str]:
+        """generate_music_params的异步版本"""
+        return await asyncio.to_thread(self.generate_music_params, user_idea)
+
+    async def agenerate_music_evaluation(self, evaluation_data: Dict) -> str:
+        """generate_music_evaluation的异步版本"""
+        return await asyncio.to_thread(self.generate_music_evaluation, evaluation_data)
+
+    async def batch_generate(
+        self, user_ideas: List[str], max_concurrency: int = 8
+    ) -> List[Dict[str, str]]:
+        """并发为一批用户想法生成音乐参数
+
+        Semaphore限制在途请求数，避免把API速率限制打爆；
+        结果顺序与输入一致。
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _one(idea: str) -> Dict[str, str]:
+            async with semaphore:
+                return await self.agenerate_music_params(idea)
+
+        return list(await asyncio.gather(*(_one(idea) for idea in user_ideas)))
+
+    def generate_music_params(self, user_idea: str, force_refresh: bool = False) -> Dict[str, str]:
         """生成音乐参数"""
         system_prompt = """你是一个专业的中文音乐创作AI助手，专门为ACE-Step音乐生成模型创作内容。
 
@@ -107,7 +445,7 @@ class LLMClient:
 
         user_prompt = f"用户想法: {user_idea}\n\n请为这个想法生成合适的音乐内容。"
         
-        return self._call_api(system_prompt, user_prompt)
+        return self._call_api(system_prompt, user_prompt, force_refresh=force_refresh)
     
     def generate_music_evaluation(self, evaluation_data: Dict) -> str:
         """生成音乐专业评价"""
@@ -161,173 +499,125 @@ class LLMClient:
         
         return summary
     
-    def _call_api(self, system_prompt: str, user_prompt: str) -> Dict[str, str]:
-        """调用阿里云API"""
+    def _call_api(self, system_prompt: str, user_prompt: str,
+                  force_refresh: bool = False) -> Dict[str, str]:
+        """调用阿里云API
+
+        结果按(模型, 提示词, 采样参数)哈希落到本地响应缓存，
+        迭代中重放相同想法时零网络往返；force_refresh=True绕过
+        缓存强制重新生成（与MCP侧cache_settings语义一致）。
+        """
         if not self.api_key:
             return self._get_fallback_content(user_prompt)
-            
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
+
+        cache_key = hashlib.blake2b(
+            orjson.dumps([self.model, system_prompt, user_prompt, 0.8, 1500]),
+            digest_size=16,
+        ).hexdigest()
+        if not force_refresh:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                try:
+                    return orjson.loads(cached)
+                except orjson.JSONDecodeError:
+                    pass
+
         data = {
-            "model": self.model,
+            **self._params_payload_template,
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.8,
-            "max_tokens": 1500
+            ]
         }
         
         try:
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=30)
+            response = self._post_with_retry(data)
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content)
             content = result["choices"][0]["message"]["content"]
             
             # 尝试解析JSON
             try:
-                music_content = json.loads(content.strip())
-                if "prompt" in music_content and "lyrics" in music_content:
-                    return music_content
-            except json.JSONDecodeError:
-                pass
-            
-            # 备用解析
-            return self._parse_response(content)
+                music_content = orjson.loads(content.strip())
+            except orjson.JSONDecodeError:
+                # 备用解析
+                music_content = self._parse_response(content)
+            if "prompt" not in music_content or "lyrics" not in music_content:
+                music_content = self._parse_response(content)
+
+            self.response_cache.put(
+                cache_key, orjson.dumps(music_content).decode("utf-8")
+            )
+            return music_content
                 
         except Exception as e:
             print(f"API调用失败: {e}")
             return self._get_fallback_content(user_prompt)
     
     def _call_llm_for_evaluation(self, system_prompt: str, user_prompt: str) -> str:
-        """调用LLM生成评价"""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 300
-        }
-        
+        """调用LLM生成评价
+
+        走SSE流式通道逐段收包，网络传输和解析重叠进行，
+        首包到达即开始处理，短回复（300 token以内）的整体延迟
+        明显低于等完整响应体。
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
         try:
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            return content.strip()
-            
+            stream = self.chat_completion_stream(
+                messages, temperature=0.7, max_tokens=300
+            )
+            return "".join(stream).strip()
+
         except Exception as e:
             return f"AI评价生成失败: {str(e)}"
     
     def _parse_response(self, content: str) -> Dict[str, str]:
-        """简单的文本解析逻辑"""
-        lines = content.split('\n')
+        """简单的文本解析逻辑（单趟正则提取，替代逐行状态机）"""
         prompt = ""
         lyrics = ""
-        
-        in_lyrics = False
-        
-        for line in lines:
-            line = line.strip()
-            if 'prompt' in line.lower() and ':' in line:
-                prompt = line.split(':', 1)[1].strip().strip('"{}')
-            elif 'lyrics' in line.lower() and ':' in line:
-                lyrics_start = line.split(':', 1)[1].strip().strip('"{}')
-                lyrics = lyrics_start
-                in_lyrics = True
-            elif in_lyrics and line and not line.startswith('{') and not line.startswith('}'):
-                lyrics += '\n' + line
-        
+
+        match = _PROMPT_RE.search(content)
+        if match:
+            prompt = match.group(1).strip().strip('"{}')
+
+        # 优先按JSON字符串形态取歌词，退化文本形态则截到闭括号/结尾
+        match = _LYRICS_JSON_RE.search(content)
+        if match:
+            lyrics = match.group(1).strip()
+        else:
+            match = _LYRICS_TEXT_RE.search(content)
+            if match:
+                lyrics = '\n'.join(
+                    stripped.strip('"{}')
+                    for line in match.group(1).splitlines()
+                    if (stripped := line.strip()) and not stripped.startswith(('{', '}'))
+                )
+
         return {
             "prompt": prompt or "Rap, adult, male, spoken word, clear",
             "lyrics": lyrics or self._get_default_lyrics()
         }
     
     def _get_fallback_content(self, user_input: str) -> Dict[str, str]:
-        """根据用户输入关键词判断风格的备用内容"""
-        user_lower = user_input.lower()
-        
-        if any(word in user_lower for word in ['伤感', '悲伤', '难过', '失落']):
-            return {
-                "prompt": "Rap, adult, male, emotional, melancholic, slow tempo, introspective, clear vocals",
-                "lyrics": """[Intro]
-夜深了，思绪又开始泛滥
-这些年的得失，在心里翻转
-
-[Verse]
-走过这么多路，回头看那些伤
-有些痛不会忘，像刻在心上的疤
-曾经以为时间会带走所有难过
-现在才发现，有些记忆越久越深刻
-
-[Chorus]
-伤感不是软弱，是成长的代价
-每一次跌倒，都让我更懂得珍惜
-虽然心会痛，但我还在这里
-用音乐诉说，那些说不出的话
+        """根据用户输入关键词判断风格的备用内容
 
-[Outro]
-伤感也是一种美
-让我学会了更深的体会"""
-            }
-        elif any(word in user_lower for word in ['激昂', '热血', '激情', '燃']):
-            return {
-                "prompt": "Rap, energetic, powerful, fast tempo, aggressive, clear, motivational",
-                "lyrics": """[Intro]
-点燃心中的火焰
-这一刻，全世界都听见我的声音
-
-[Verse]
-不服输的心永远年轻
-每一次挑战都让我更加坚定
-汗水是我最好的证明
-成功的路上从不缺少拼搏的身影
-
-[Chorus]
-热血在沸腾，梦想在召唤
-没有什么能阻挡我前进的步伐
-燃烧吧青春，释放吧力量
-这是属于我们的时代
+        返回的是模块级常量字典的浅拷贝，调用方可以安全改写
+        顶层键而不污染常量。
+        """
+        user_lower = user_input.lower()
 
-[Outro]
-永不熄灭的火
-照亮前行的路"""
-            }
+        if any(word in user_lower for word in _SAD_WORDS):
+            return dict(_FALLBACK_SAD)
+        elif any(word in user_lower for word in _ENERGETIC_WORDS):
+            return dict(_FALLBACK_ENERGETIC)
         else:
-            return {
-                "prompt": "Rap, adult, male, spoken word, moderate tempo, clear, versatile",
-                "lyrics": """[Intro]
-这是我的声音，这是我的故事
-
-[Verse]
-生活就像一场说唱
-有高有低，有快有慢
-重要的是保持自己的节拍
-在这个世界上留下属于自己的印记
+            return dict(_FALLBACK_DEFAULT)
 
-[Chorus]
-用音乐表达内心的想法
-让每一个音符都有灵魂
-这就是说唱的魅力
-真实而有力量
-
-[Outro]
-音乐永不停息
-我们的故事还在继续"""
-            }
-    
     def _get_default_lyrics(self) -> str:
         """默认歌词"""
         return """[Intro]
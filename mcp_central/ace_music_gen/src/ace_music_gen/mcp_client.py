@@ -2,10 +2,16 @@
 
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import Any, Dict, Optional, List
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional, List, Tuple
 import requests
 
+from .http_pool import get_session
 from .session_state import MusicGenerationResult
 
 
@@ -25,7 +31,8 @@ class ACEStepMCPClient:
         env_url = os.environ.get("ACE_MCP_BASE_URL")
         self.base_url = (base_url or env_url or "http://127.0.0.1:8000").rstrip("/")
         self.timeout = timeout
-        self.session = session or requests.Session()
+        # 默认挂到进程级共享连接池上，与LLM客户端复用底层连接
+        self.session = session or get_session()
 
     # ------------------------------------------------------------------
     # 公共 API
@@ -34,7 +41,7 @@ class ACEStepMCPClient:
         """检查 MCP 服务器健康状态。返回 JSON 字典，如失败则抛出 MCPError。"""
         url = f"{self.base_url}/health"
         try:
-            response = self.session.get(url, timeout=10, headers={"Connection": "close"})
+            response = self.session.get(url, timeout=10)
             response.raise_for_status()
             return response.json()
         except Exception as exc:  # pragma: no cover - 运行时保护
@@ -94,8 +101,7 @@ class ACEStepMCPClient:
             response = self.session.post(
                 url,
                 json=payload,
-                timeout=self.timeout,
-                headers={"Connection": "close"}
+                timeout=self.timeout
             )
             response.raise_for_status()
             result_data = response.json()
@@ -136,6 +142,141 @@ class ACEStepMCPClient:
                 error=f"调用 MCP 服务失败: {str(exc)}"
             )
 
+    def generate_music_streaming(
+        self,
+        prompt: str,
+        lyrics: str,
+        audio_duration: float = 30.0,
+        candidate_count: int = 3,
+        guidance_schedule: Optional[List[Dict[str, float]]] = None,
+        lora_config: Optional[Dict[str, Any]] = None,
+        cache_settings: Optional[Dict[str, bool]] = None,
+        poll_interval: float = 1.0
+    ) -> Iterator[Tuple[str, Any]]:
+        """流式调用音乐生成，边等待边产出进度事件。
+
+        服务端目前没有分块音频接口，这里把阻塞的generate_music放到
+        后台线程，调用方在等待期间持续拿到("progress", 已耗时秒数)
+        心跳，最后拿到("result", MusicGenerationResult)，而不是被
+        整段生成时间阻塞。
+
+        Yields:
+            ("progress", float): 自请求发出以来的耗时（秒）
+            ("result", MusicGenerationResult): 最终生成结果
+        """
+        result_queue: "queue.Queue" = queue.Queue(maxsize=1)
+
+        def _worker():
+            # 任何异常都要进队列，否则消费端会在progress心跳里永远空转
+            try:
+                result_queue.put(
+                    self.generate_music(
+                        prompt=prompt,
+                        lyrics=lyrics,
+                        audio_duration=audio_duration,
+                        candidate_count=candidate_count,
+                        guidance_schedule=guidance_schedule,
+                        lora_config=lora_config,
+                        cache_settings=cache_settings,
+                    )
+                )
+            except BaseException as e:
+                result_queue.put(e)
+
+        thread = threading.Thread(target=_worker, daemon=True)
+        thread.start()
+
+        start = time.time()
+        while True:
+            try:
+                result = result_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                yield ("progress", time.time() - start)
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            yield ("result", result)
+            return
+
+    async def agenerate_music(
+        self,
+        prompt: str,
+        lyrics: str,
+        audio_duration: float = 30.0,
+        candidate_count: int = 3,
+        guidance_schedule: Optional[List[Dict[str, float]]] = None,
+        lora_config: Optional[Dict[str, Any]] = None,
+        cache_settings: Optional[Dict[str, bool]] = None
+    ) -> MusicGenerationResult:
+        """generate_music的异步包装
+
+        阻塞的HTTP调用放到线程池执行，事件循环在长任务
+        （最长timeout=300秒）期间保持可调度，多个生成任务
+        可以在同一进程内并发提交。
+        """
+        return await asyncio.to_thread(
+            self.generate_music,
+            prompt=prompt,
+            lyrics=lyrics,
+            audio_duration=audio_duration,
+            candidate_count=candidate_count,
+            guidance_schedule=guidance_schedule,
+            lora_config=lora_config,
+            cache_settings=cache_settings,
+        )
+
+    async def batch_generate(
+        self,
+        items: List[Tuple[str, str]],
+        max_concurrency: int = 4,
+        **kwargs: Any,
+    ) -> List[MusicGenerationResult]:
+        """并发提交多个(prompt, lyrics)生成任务，按输入顺序返回结果
+
+        共享同一个连接池的Session，TCP/TLS成本只付一次；
+        Semaphore限制在途请求数，避免压垮MCP服务。
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _bounded(prompt: str, lyrics: str) -> MusicGenerationResult:
+            async with semaphore:
+                return await self.agenerate_music(prompt, lyrics, **kwargs)
+
+        return list(await asyncio.gather(
+            *(_bounded(prompt, lyrics) for prompt, lyrics in items)
+        ))
+
+    def generate_music_batch(
+        self,
+        items: List[Tuple[str, str]],
+        max_workers: int = 4,
+        **kwargs: Any,
+    ) -> List[MusicGenerationResult]:
+        """批量提交生成任务，按输入顺序返回结果
+
+        MCP服务端暂时只有单请求的/generate_music端点，这里在
+        客户端做并发提交：所有请求走共享连接池，TCP握手和
+        序列化成本只按连接数摊一次，而不是每个候选各付一份。
+        服务端支持批量端点后可以换成单次POST。
+
+        Args:
+            items: (prompt, lyrics)二元组列表
+            max_workers: 并发提交的线程数上限
+            **kwargs: 透传给generate_music的其余参数
+
+        Returns:
+            与items顺序一致的MusicGenerationResult列表
+        """
+        if not items:
+            return []
+
+        def _one(item: Tuple[str, str]) -> MusicGenerationResult:
+            prompt, lyrics = item
+            return self.generate_music(prompt=prompt, lyrics=lyrics, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+            return list(pool.map(_one, items))
+
     def generate_music_legacy(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """传统的generate_music接口（向后兼容）"""
         url = f"{self.base_url}/generate_music"
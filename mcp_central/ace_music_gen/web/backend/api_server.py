@@ -6,14 +6,16 @@ FastAPI 桥接层，包装 InteractiveMusicAgent 为 RESTful API
 import os
 import sys
 from contextlib import asynccontextmanager
+from pathlib import Path
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 import uvicorn
 
-# 添加项目根目录到Python路径
-project_root = os.path.join(os.path.dirname(__file__), "../../")
-sys.path.insert(0, project_root)
+# 添加项目根目录到Python路径（规范化绝对路径，重复导入时不再追加）
+project_root = str(Path(__file__).resolve().parents[2])
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
 
 from .routes import session_router, chat_router, media_router
 from .state_tracker import state_tracker
@@ -30,6 +32,10 @@ async def lifespan(app: FastAPI):
     if not api_key:
         print("⚠️  警告: 未设置 ACE_MUSIC_GEN_API_KEY 环境变量")
 
+    # 启动时把OpenAPI schema算好缓存到app.openapi_schema，
+    # 首个/docs或/openapi.json请求不再现场遍历所有模型生成
+    app.openapi()
+
     yield
 
     # 关闭时的清理
@@ -41,13 +47,18 @@ app = FastAPI(
     title="ACE Music Gen API",
     description="ACE 音乐生成器 Web API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # 所有路由默认走orjson序列化，/state这类带完整会话历史的
+    # 大响应不再经过stdlib json的纯Python编码
+    default_response_class=ORJSONResponse
 )
 
 # CORS中间件
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000", "http://192.168.1.2:3000"],  # 前端地址
+    # 前端地址：localhost/127.0.0.1/192.168.1.2的3000端口，
+    # Starlette导入时编译一次正则，逐请求匹配不再线性扫列表
+    allow_origin_regex=r"^http://(localhost|127\.0\.0\.1|192\.168\.1\.2):3000$",
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
@@ -59,7 +70,7 @@ app.add_middleware(
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """全局异常处理器"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "success": False,
@@ -127,7 +138,13 @@ def main():
         host=args.host,
         port=args.port,
         reload=args.reload,
-        log_level=args.log_level
+        log_level=args.log_level,
+        # 会话状态（state_tracker、Agent实例缓存）都在进程内，
+        # 多worker会fork出互不一致的副本，只支持单进程运行
+        # auto在装有uvloop/httptools（web extra）时自动启用，
+        # 否则回退到asyncio+h11
+        loop="auto",
+        http="auto"
     )
 
 
@@ -1,15 +1,113 @@
 """API 响应模型"""
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from types import MappingProxyType
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-import uuid
+
+from src.ace_music_gen.ids import fast_uuid4_str
+
+
+
+# 各响应模型的OpenAPI示例：模块级只读常量，类定义时引用一次，
+# schema生成路径上不再复制或重建这些字典
+_ERROR_EXAMPLE = MappingProxyType({
+    "success": False,
+    "error": {
+        "code": "VALIDATION_ERROR",
+        "message": "输入参数验证失败",
+        "details": {"field": "audio_duration", "reason": "必须大于0"}
+    },
+    "request_id": "123e4567-e89b-12d3-a456-426614174000"
+})
+
+_SESSION_START_EXAMPLE = MappingProxyType({
+    "success": True,
+    "data": {
+        "session_id": "123e4567-e89b-12d3-a456-426614174000",
+        "created_at": "2024-01-01T00:00:00Z",
+        "status": "initializing"
+    },
+    "request_id": "123e4567-e89b-12d3-a456-426614174001"
+})
+
+_CHAT_MESSAGE_EXAMPLE = MappingProxyType({
+    "success": True,
+    "data": {
+        "message_id": "123e4567-e89b-12d3-a456-426614174000",
+        "agent_response": "我了解您想要一首伤感的说唱歌曲...",
+        "stage": "collecting_requirements",
+        "next_action": "继续收集具体需求"
+    },
+    "request_id": "123e4567-e89b-12d3-a456-426614174001"
+})
+
+_SESSION_STATE_EXAMPLE = MappingProxyType({
+    "success": True,
+    "data": {
+        "session_id": "123e4567-e89b-12d3-a456-426614174000",
+        "current_stage": "generating_lyrics",
+        "stage_description": "正在生成歌词候选版本...",
+        "progress_percentage": 65.5,
+        "conversation_history": [],
+        "user_requirement": {},
+        "lyrics_versions": []
+    },
+    "request_id": "123e4567-e89b-12d3-a456-426614174001"
+})
+
+_SESSION_RESULT_EXAMPLE = MappingProxyType({
+    "success": True,
+    "data": {
+        "audio_files": [
+            {
+                "url": "/api/v1/media/session_id/audio_1.wav",
+                "filename": "audio_1.wav",
+                "duration": 30.2,
+                "score": 8.5
+            }
+        ],
+        "final_lyrics": "最终确认的歌词内容...",
+        "metadata": {
+            "generation_time": 125.3,
+            "quality_scores": {"overall": 8.5}
+        }
+    },
+    "request_id": "123e4567-e89b-12d3-a456-426614174001"
+})
+
+_SESSION_LIST_EXAMPLE = MappingProxyType({
+    "success": True,
+    "data": {
+        "sessions": [
+            {
+                "session_id": "123e4567-e89b-12d3-a456-426614174000",
+                "created_at": "2024-01-01T00:00:00Z",
+                "status": "completed",
+                "summary": {
+                    "style": "伤感说唱",
+                    "duration": 30.0,
+                    "audio_count": 3
+                }
+            }
+        ],
+        "total": 50,
+        "has_more": True
+    },
+    "request_id": "123e4567-e89b-12d3-a456-426614174001"
+})
 
 
 class BaseResponse(BaseModel):
-    """基础响应模型"""
+    """基础响应模型
+
+    响应对象构造后只做序列化，frozen交给pydantic-core当不可变
+    结构处理，子类的model_config会与这里自动合并。
+    """
+    model_config = ConfigDict(frozen=True)
+
     success: bool = Field(..., description="操作是否成功")
-    request_id: str = Field(default_factory=lambda: str(uuid.uuid4()), description="请求ID")
+    request_id: str = Field(default_factory=fast_uuid4_str, description="请求ID")
 
 
 class ErrorResponse(BaseResponse):
@@ -17,131 +115,39 @@ class ErrorResponse(BaseResponse):
     success: bool = Field(default=False)
     error: Dict[str, Any] = Field(..., description="错误信息")
 
-    class Config:
-        schema_extra = {
-            "example": {
-                "success": False,
-                "error": {
-                    "code": "VALIDATION_ERROR",
-                    "message": "输入参数验证失败",
-                    "details": {"field": "audio_duration", "reason": "必须大于0"}
-                },
-                "request_id": "123e4567-e89b-12d3-a456-426614174000"
-            }
-        }
+    model_config = ConfigDict(json_schema_extra={"example": _ERROR_EXAMPLE})
 
 
 class SessionStartResponse(BaseResponse):
     """会话创建响应"""
     data: Dict[str, Any] = Field(..., description="会话数据")
 
-    class Config:
-        schema_extra = {
-            "example": {
-                "success": True,
-                "data": {
-                    "session_id": "123e4567-e89b-12d3-a456-426614174000",
-                    "created_at": "2024-01-01T00:00:00Z",
-                    "status": "initializing"
-                },
-                "request_id": "123e4567-e89b-12d3-a456-426614174001"
-            }
-        }
+    model_config = ConfigDict(json_schema_extra={"example": _SESSION_START_EXAMPLE})
 
 
 class ChatMessageResponse(BaseResponse):
     """聊天消息响应"""
     data: Dict[str, Any] = Field(..., description="消息数据")
 
-    class Config:
-        schema_extra = {
-            "example": {
-                "success": True,
-                "data": {
-                    "message_id": "123e4567-e89b-12d3-a456-426614174000",
-                    "agent_response": "我了解您想要一首伤感的说唱歌曲...",
-                    "stage": "collecting_requirements",
-                    "next_action": "继续收集具体需求"
-                },
-                "request_id": "123e4567-e89b-12d3-a456-426614174001"
-            }
-        }
+    model_config = ConfigDict(json_schema_extra={"example": _CHAT_MESSAGE_EXAMPLE})
 
 
 class SessionStateResponse(BaseResponse):
     """会话状态响应"""
     data: Dict[str, Any] = Field(..., description="会话状态数据")
 
-    class Config:
-        schema_extra = {
-            "example": {
-                "success": True,
-                "data": {
-                    "session_id": "123e4567-e89b-12d3-a456-426614174000",
-                    "current_stage": "generating_lyrics",
-                    "stage_description": "正在生成歌词候选版本...",
-                    "progress_percentage": 65.5,
-                    "conversation_history": [],
-                    "user_requirement": {},
-                    "lyrics_versions": []
-                },
-                "request_id": "123e4567-e89b-12d3-a456-426614174001"
-            }
-        }
+    model_config = ConfigDict(json_schema_extra={"example": _SESSION_STATE_EXAMPLE})
 
 
 class SessionResultResponse(BaseResponse):
     """会话结果响应"""
     data: Dict[str, Any] = Field(..., description="会话结果数据")
 
-    class Config:
-        schema_extra = {
-            "example": {
-                "success": True,
-                "data": {
-                    "audio_files": [
-                        {
-                            "url": "/api/v1/media/session_id/audio_1.wav",
-                            "filename": "audio_1.wav",
-                            "duration": 30.2,
-                            "score": 8.5
-                        }
-                    ],
-                    "final_lyrics": "最终确认的歌词内容...",
-                    "metadata": {
-                        "generation_time": 125.3,
-                        "quality_scores": {"overall": 8.5}
-                    }
-                },
-                "request_id": "123e4567-e89b-12d3-a456-426614174001"
-            }
-        }
+    model_config = ConfigDict(json_schema_extra={"example": _SESSION_RESULT_EXAMPLE})
 
 
 class SessionListResponse(BaseResponse):
     """会话列表响应"""
     data: Dict[str, Any] = Field(..., description="会话列表数据")
 
-    class Config:
-        schema_extra = {
-            "example": {
-                "success": True,
-                "data": {
-                    "sessions": [
-                        {
-                            "session_id": "123e4567-e89b-12d3-a456-426614174000",
-                            "created_at": "2024-01-01T00:00:00Z",
-                            "status": "completed",
-                            "summary": {
-                                "style": "伤感说唱",
-                                "duration": 30.0,
-                                "audio_count": 3
-                            }
-                        }
-                    ],
-                    "total": 50,
-                    "has_more": True
-                },
-                "request_id": "123e4567-e89b-12d3-a456-426614174001"
-            }
-        }
\ No newline at end of file
+    model_config = ConfigDict(json_schema_extra={"example": _SESSION_LIST_EXAMPLE})
@@ -2,8 +2,12 @@
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from typing import Optional
+from collections import OrderedDict
+from threading import Lock
 import asyncio
+import itertools
 import os
+import time
 
 from ..models.requests import ChatMessageRequest, LyricsReviewRequest
 from ..models.responses import ChatMessageResponse, ErrorResponse
@@ -25,8 +29,16 @@ from src.ace_music_gen.agent_hooks import (
 
 router = APIRouter(prefix="/session", tags=["chat"])
 
-# 全局Agent实例缓存
-_agent_instances = {}
+# 全局Agent实例缓存（LRU有界，长期运行的服务不会无限囤积Agent）
+_AGENT_CACHE_SIZE = int(os.getenv("ACE_AGENT_CACHE_SIZE", "256"))
+_agent_instances: "OrderedDict[str, InteractiveMusicAgent]" = OrderedDict()
+_agent_instances_lock = Lock()
+
+# 限制同时进入线程池的LLM/MCP调用数量，多会话并发时避免压垮上游
+_LLM_SEM = asyncio.Semaphore(int(os.getenv("ACE_AGENT_CONCURRENCY", "4")))
+
+# 消息ID用单调计数器，同一毫秒内多条消息也不会撞号
+_MSG_COUNTER = itertools.count(int(time.time() * 1000))
 
 
 # 设置事件钩子以连接Agent事件系统和state_tracker
@@ -89,24 +101,34 @@ _setup_event_hooks()
 
 def get_agent_instance(session_id: str) -> InteractiveMusicAgent:
     """获取或创建Agent实例"""
-    if session_id not in _agent_instances:
-        # 创建LLM和MCP客户端
-        api_key = os.getenv("ACE_MUSIC_GEN_API_KEY")
-        if not api_key:
-            raise ValueError("缺少 ACE_MUSIC_GEN_API_KEY 环境变量")
+    with _agent_instances_lock:
+        agent = _agent_instances.get(session_id)
+        if agent is not None:
+            _agent_instances.move_to_end(session_id)
+            return agent
 
-        llm_client = LLMClient(api_key=api_key)
-        mcp_client = ACEStepMCPClient()
+    # 创建LLM和MCP客户端
+    api_key = os.getenv("ACE_MUSIC_GEN_API_KEY")
+    if not api_key:
+        raise ValueError("缺少 ACE_MUSIC_GEN_API_KEY 环境变量")
 
-        # 创建Agent实例
-        agent = InteractiveMusicAgent(llm_client, mcp_client)
+    llm_client = LLMClient(api_key=api_key)
+    mcp_client = ACEStepMCPClient()
 
-        # 包装Agent方法以集成状态跟踪
-        agent = _wrap_agent_with_state_tracking(agent, session_id)
+    # 创建Agent实例
+    agent = InteractiveMusicAgent(llm_client, mcp_client)
 
-        _agent_instances[session_id] = agent
+    # 包装Agent方法以集成状态跟踪
+    agent = _wrap_agent_with_state_tracking(agent, session_id)
 
-    return _agent_instances[session_id]
+    with _agent_instances_lock:
+        # 超出上限时淘汰最久未用的Agent；HTTP连接池是进程级共享的，
+        # 直接丢弃即可，不需要逐个关闭Session
+        while len(_agent_instances) >= _AGENT_CACHE_SIZE:
+            _agent_instances.popitem(last=False)
+        agent = _agent_instances.setdefault(session_id, agent)
+
+    return agent
 
 
 def _wrap_agent_with_state_tracking(agent: InteractiveMusicAgent, session_id: str):
@@ -132,23 +154,26 @@ def _wrap_agent_with_state_tracking(agent: InteractiveMusicAgent, session_id: st
     return agent
 
 
+# 每次阶段变更需要同步到tracker的会话属性（含ReAct元数据）
+_SYNC_ATTRS = (
+    'current_stage', 'user_requirement', 'lyrics_versions',
+    'selected_lyrics', 'generation_result',
+    'actions', 'thoughts', 'final_assets'
+)
+_MISSING = object()
+
+
 def _sync_agent_to_tracker(agent: InteractiveMusicAgent, session_id: str):
     """同步Agent状态到state_tracker"""
     tracker_session = state_tracker.get_session(session_id)
     if tracker_session:
-        tracker_session.current_stage = agent.session.current_stage
-        tracker_session.user_requirement = agent.session.user_requirement
-        tracker_session.lyrics_versions = agent.session.lyrics_versions
-        tracker_session.selected_lyrics = agent.session.selected_lyrics
-        tracker_session.generation_result = agent.session.generation_result
-
-        # 同步ReAct元数据
-        if hasattr(agent.session, 'actions'):
-            tracker_session.actions = agent.session.actions
-        if hasattr(agent.session, 'thoughts'):
-            tracker_session.thoughts = agent.session.thoughts
-        if hasattr(agent.session, 'final_assets'):
-            tracker_session.final_assets = agent.session.final_assets
+        agent_session = agent.session
+        for attr in _SYNC_ATTRS:
+            value = getattr(agent_session, attr, _MISSING)
+            if value is not _MISSING:
+                setattr(tracker_session, attr, value)
+        # 直接改了tracker会话的字段，手动作废快照缓存
+        state_tracker._bump_version(tracker_session)
 
 
 async def process_message_async(session_id: str, content: str):
@@ -183,29 +208,33 @@ async def agent_react_loop(agent, session_id: str, user_input: str):
     """Agent的ReAct思考→行动循环"""
     max_iterations = 10
     iteration = 0
+    progress_event = state_tracker.get_progress_event(session_id)
+    # 每轮的调试日志攒在本地，迭代结束一次性落盘+推送，减少锁/队列往返
+    pending_logs = []
 
     while iteration < max_iterations:
         iteration += 1
-        state_tracker.add_debug_log(session_id, f"ReAct循环第{iteration}轮")
+        pending_logs.append(f"ReAct循环第{iteration}轮")
 
-        # 步骤1: 思考 (Reasoning)
-        thought = await agent_think(agent, session_id, user_input)
+        # 步骤1+2: 思考与决策并发执行（决策只看current_stage，不依赖思考文本）
+        thought, action = await asyncio.gather(
+            agent_think(agent, session_id, user_input),
+            agent_decide_action(agent, session_id)
+        )
         if thought:
             state_tracker.add_conversation(session_id, "assistant", f"💭 思考: {thought}")
 
-        # 步骤2: 决定行动 (Action)
-        action = await agent_decide_action(agent, session_id)
         if not action:
             break
 
-        state_tracker.add_debug_log(session_id, f"决定执行行动: {action['type']}")
+        pending_logs.append(f"决定执行行动: {action['type']}")
 
         # 步骤3: 执行行动
         action_result = await agent_execute_action(agent, session_id, action)
 
         # 步骤4: 观察结果，决定是否继续
         if action.get('type') == 'complete':
-            state_tracker.add_debug_log(session_id, "Agent任务完成")
+            pending_logs.append("Agent任务完成")
             break
 
         # 如果是生成音乐，开始异步生成
@@ -213,7 +242,32 @@ async def agent_react_loop(agent, session_id: str, user_input: str):
             await start_music_generation(agent, session_id)
             break
 
-        await asyncio.sleep(0.5)  # 避免过快循环
+        state_tracker.add_debug_logs(session_id, pending_logs)
+        pending_logs.clear()
+
+        # 等状态更新被唤醒，真正空闲时才短暂停留，不再固定睡0.5秒。
+        # 本轮自己的add_conversation/update_stage也会set这个事件，
+        # 先清掉再等，只有等待期间新到的外部更新才立刻唤醒，
+        # 否则每轮都立即返回，循环会瞬间烧完max_iterations
+        progress_event.clear()
+        try:
+            await asyncio.wait_for(progress_event.wait(), timeout=5.0)
+        except asyncio.TimeoutError:
+            pass
+
+    # break路径上可能还有未推送的日志
+    state_tracker.add_debug_logs(session_id, pending_logs)
+
+
+# 各阶段的思考模板；{ctx}占位的才需要format
+_STAGE_THOUGHTS = {
+    "init": "用户想要生成音乐：{ctx}。我需要分析他们的需求，然后生成合适的歌词。",
+    "collecting_requirements": "我需要进一步了解用户的具体需求，如音乐风格、情绪等。",
+    "generating_lyrics": "我正在基于用户需求生成歌词候选版本。",
+    "reviewing_lyrics": "我需要展示歌词给用户审核，等待他们的反馈。",
+    "preparing_generation": "歌词已确认，我需要准备音乐生成参数。",
+    "generating_music": "正在调用MCP服务生成音乐...",
+}
 
 
 async def agent_think(agent, session_id: str, context: str) -> str:
@@ -221,29 +275,29 @@ async def agent_think(agent, session_id: str, context: str) -> str:
     current_stage = agent.session.current_stage
 
     # 根据当前阶段和上下文进行思考
-    thought = None
-    if current_stage == "init":
-        thought = f"用户想要生成音乐：{context}。我需要分析他们的需求，然后生成合适的歌词。"
-    elif current_stage == "collecting_requirements":
-        thought = "我需要进一步了解用户的具体需求，如音乐风格、情绪等。"
-    elif current_stage == "generating_lyrics":
-        thought = "我正在基于用户需求生成歌词候选版本。"
-    elif current_stage == "reviewing_lyrics":
-        thought = "我需要展示歌词给用户审核，等待他们的反馈。"
-    elif current_stage == "preparing_generation":
-        thought = "歌词已确认，我需要准备音乐生成参数。"
-    elif current_stage == "generating_music":
-        thought = "正在调用MCP服务生成音乐..."
+    template = _STAGE_THOUGHTS.get(current_stage)
+    if template is None:
+        return None
+
+    thought = template.format(ctx=context) if "{ctx}" in template else template
 
     # 记录思考过程到session
-    if thought:
-        agent.session.add_thought(thought)
-        # 发射思考事件
-        await global_hook_manager.emit_thought_event(session_id, thought, current_stage)
+    agent.session.add_thought(thought)
+    # 发射思考事件
+    await global_hook_manager.emit_thought_event(session_id, thought, current_stage)
 
     return thought
 
 
+# 各阶段对应的默认行动；reviewing_lyrics需要看审核状态，单独处理
+_STAGE_ACTION = {
+    "init": "analyze_requirements",
+    "collecting_requirements": "generate_lyrics",
+    "generating_lyrics": "present_lyrics",
+    "completed": "complete",
+}
+
+
 async def agent_decide_action(agent, session_id: str) -> dict:
     """Agent决定下一步行动"""
     current_stage = agent.session.current_stage
@@ -251,56 +305,50 @@ async def agent_decide_action(agent, session_id: str) -> dict:
     # 调试日志
     state_tracker.add_debug_log(session_id, f"Agent current stage: {current_stage}")
 
-    if current_stage == "init":
-        return {"type": "analyze_requirements", "data": {}}
-    elif current_stage == "collecting_requirements":
-        return {"type": "generate_lyrics", "data": {}}
-    elif current_stage == "generating_lyrics":
-        return {"type": "present_lyrics", "data": {}}
-    elif current_stage == "reviewing_lyrics":
-        if agent.session.lyrics_versions and hasattr(agent.session.lyrics_versions[0], 'approved') and agent.session.lyrics_versions[0].approved:
+    if current_stage == "reviewing_lyrics":
+        lyrics_versions = agent.session.lyrics_versions
+        if lyrics_versions and getattr(lyrics_versions[0], 'approved', False):
             return {"type": "generate_music", "data": {}}
-        else:
-            return {"type": "wait_for_review", "data": {}}
-    elif current_stage == "completed":
-        return {"type": "complete", "data": {}}
+        return {"type": "wait_for_review", "data": {}}
+
+    action_type = _STAGE_ACTION.get(current_stage)
+    if action_type is None:
+        # 如果stage不匹配，默认回到分析需求
+        state_tracker.add_debug_log(session_id, f"Unknown stage '{current_stage}', defaulting to analyze_requirements")
+        action_type = "analyze_requirements"
 
-    # 如果stage不匹配，默认回到分析需求
-    state_tracker.add_debug_log(session_id, f"Unknown stage '{current_stage}', defaulting to analyze_requirements")
-    return {"type": "analyze_requirements", "data": {}}
+    return {"type": action_type, "data": {}}
 
 
 async def agent_execute_action(agent, session_id: str, action: dict) -> str:
     """执行Agent行动"""
-    import time
     start_time = time.time()
     action_type = action["type"]
     result = None
     error = None
 
     try:
+        # 整个行动只取一次tracker会话，避免每个分支重复拿锁查表
+        tracker_session = state_tracker.get_session(session_id)
+
         if action_type == "analyze_requirements":
             # 分析用户需求
             # 从state_tracker获取最新的用户消息
-            session = state_tracker.get_session(session_id)
-            if session and session.conversation_history:
-                last_user_message = None
-                for turn in reversed(session.conversation_history):
-                    if turn.role == "user":
-                        last_user_message = turn.content
-                        break
+            if tracker_session and tracker_session.conversation_history:
+                # add_conversation时已缓存最近的用户消息，O(1)读取
+                last_user_turn = getattr(tracker_session, 'last_user_turn', None)
+                last_user_message = last_user_turn.content if last_user_turn else None
 
                 if last_user_message:
-                    response = await asyncio.to_thread(agent.process_user_input, last_user_message)
+                    async with _LLM_SEM:
+                        response = await asyncio.to_thread(agent.process_user_input, last_user_message)
                     state_tracker.add_conversation(session_id, "assistant", response)
 
                     # 确保用户需求已经设置并同步到state_tracker
                     if agent.session.user_requirement:
                         # 同步Agent的session状态到state_tracker
-                        tracker_session = state_tracker.get_session(session_id)
-                        if tracker_session:
-                            tracker_session.user_requirement = agent.session.user_requirement
-                            tracker_session.current_stage = agent.session.current_stage
+                        tracker_session.user_requirement = agent.session.user_requirement
+                        tracker_session.current_stage = agent.session.current_stage
 
                         # 需求收集完成，可以进入歌词生成
                         state_tracker.update_stage(session_id, "collecting_requirements", "用户需求已分析，准备生成歌词")
@@ -320,11 +368,11 @@ async def agent_execute_action(agent, session_id: str, action: dict) -> str:
 
             try:
                 # 确保Agent有用户需求数据
-                tracker_session = state_tracker.get_session(session_id)
                 if tracker_session and tracker_session.user_requirement and not agent.session.user_requirement:
                     agent.session.user_requirement = tracker_session.user_requirement
 
-                lyrics_candidates = await asyncio.to_thread(agent._generate_lyrics_candidates)
+                async with _LLM_SEM:
+                    lyrics_candidates = await asyncio.to_thread(agent._generate_lyrics_candidates)
                 if lyrics_candidates:
                     agent.session.lyrics_versions = lyrics_candidates
                     agent.session.update_stage("reviewing_lyrics")
@@ -404,10 +452,12 @@ async def start_music_generation(agent, session_id: str):
             agent.session.selected_lyrics = selected_lyrics
 
             # 构建生成参数
-            params = await asyncio.to_thread(agent._build_generation_params, selected_lyrics)
+            async with _LLM_SEM:
+                params = await asyncio.to_thread(agent._build_generation_params, selected_lyrics)
 
             # 调用MCP生成音乐
-            result = await asyncio.to_thread(agent._invoke_mcp, params)
+            async with _LLM_SEM:
+                result = await asyncio.to_thread(agent._invoke_mcp, params)
 
             # 保存结果
             agent.session.generation_result = result
@@ -488,7 +538,7 @@ async def send_message(
 
     try:
         # 立即返回响应，在后台处理消息
-        message_id = f"msg_{int(asyncio.get_event_loop().time())}"
+        message_id = f"msg_{next(_MSG_COUNTER)}"
 
         background_tasks.add_task(
             process_message_async,
@@ -534,6 +584,17 @@ async def review_lyrics(
         )
 
     try:
+        # 把审核结果落到具体的歌词版本上；批准时同步selected_lyrics，
+        # 之后查询结果就是O(1)指针读取，不用再反向扫描版本列表
+        for lyrics in session.lyrics_versions:
+            if lyrics.version == request.version:
+                lyrics.approved = request.approved
+                if request.feedback:
+                    lyrics.user_feedback = request.feedback
+                if request.approved:
+                    session.selected_lyrics = lyrics
+                break
+
         # 更新歌词审核状态
         state_tracker.update_stage(
             session_id,
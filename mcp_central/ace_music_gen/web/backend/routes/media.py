@@ -1,18 +1,36 @@
 """媒体文件路由"""
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import FileResponse
 from typing import Optional
+from datetime import datetime
 import os
 import mimetypes
 
+# 输出目录只在进程启动时解析一次，请求路径上不再调os.getcwd()
+# TODO: 从配置获取outputs目录
+OUTPUTS_DIR = os.path.realpath(
+    os.environ.get("ACE_OUTPUTS_DIR", os.path.join(os.getcwd(), "outputs"))
+)
+
 from ..state_tracker import state_tracker
 
 router = APIRouter(prefix="/media", tags=["media"])
 
+# 常见扩展名直接查表，避免每个文件都走mimetypes的表解析
+_MIME_CACHE = {
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav',
+    '.flac': 'audio/flac',
+    '.ogg': 'audio/ogg',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+}
+
 
 @router.get("/{session_id}/{filename}")
-async def get_media_file(
+def get_media_file(
+    request: Request,
     session_id: str,
     filename: str,
     token: Optional[str] = Query(None, description="访问令牌")
@@ -30,13 +48,12 @@ async def get_media_file(
         )
 
     # 构造文件路径
-    # TODO: 从配置获取outputs目录
-    outputs_dir = os.path.join(os.getcwd(), "outputs")
-    session_dir = os.path.join(outputs_dir, f"session_{session_id}")
+    session_dir = os.path.join(OUTPUTS_DIR, f"session_{session_id}")
     file_path = os.path.join(session_dir, filename)
 
-    # 安全检查：确保文件在允许的目录内
-    if not os.path.abspath(file_path).startswith(os.path.abspath(session_dir)):
+    # 安全检查：确保文件在允许的目录内（realpath同时挡住符号链接逃逸）
+    abs_file_path = os.path.realpath(file_path)
+    if os.path.commonpath([session_dir, abs_file_path]) != session_dir:
         raise HTTPException(
             status_code=400,
             detail={
@@ -45,8 +62,10 @@ async def get_media_file(
             }
         )
 
-    # 检查文件是否存在
-    if not os.path.exists(file_path):
+    # 检查文件是否存在（stat结果留给FileResponse复用，省一次重复stat）
+    try:
+        stat_result = os.stat(file_path)
+    except FileNotFoundError:
         raise HTTPException(
             status_code=404,
             detail={
@@ -55,6 +74,19 @@ async def get_media_file(
             }
         )
 
+    # 生成的音频一旦落盘就不会变，(mtime, size)弱ETag足够让浏览器重放命中304
+    etag = f'W/"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    if request.headers.get("if-none-match") == etag:
+        # 304也要带CORS头，否则跨域客户端恰好在重验证成功时被浏览器拦下
+        return Response(
+            status_code=304,
+            headers={
+                "Access-Control-Allow-Origin": "*",
+                "ETag": etag,
+                "Cache-Control": "public, max-age=3600"
+            }
+        )
+
     # 检查文件类型
     mime_type, _ = mimetypes.guess_type(file_path)
     if not mime_type or not mime_type.startswith(('audio/', 'image/')):
@@ -75,15 +107,17 @@ async def get_media_file(
         path=file_path,
         media_type=mime_type,
         filename=filename,
+        stat_result=stat_result,
         headers={
             "Access-Control-Allow-Origin": "*",
-            "Cache-Control": "public, max-age=3600"
+            "Cache-Control": "public, max-age=3600",
+            "ETag": etag
         }
     )
 
 
 @router.get("/{session_id}/files")
-async def list_session_files(session_id: str):
+def list_session_files(session_id: str):
     """列出会话的所有文件"""
     session = state_tracker.get_session(session_id)
     if not session:
@@ -96,31 +130,37 @@ async def list_session_files(session_id: str):
         )
 
     # 构造会话目录路径
-    outputs_dir = os.path.join(os.getcwd(), "outputs")
-    session_dir = os.path.join(outputs_dir, f"session_{session_id}")
-
-    files = []
-    if os.path.exists(session_dir):
-        for filename in os.listdir(session_dir):
-            file_path = os.path.join(session_dir, filename)
-
-            if os.path.isfile(file_path):
-                # 获取文件信息
-                stat = os.stat(file_path)
-                mime_type, _ = mimetypes.guess_type(file_path)
-
-                files.append({
-                    "filename": filename,
+    session_dir = os.path.join(OUTPUTS_DIR, f"session_{session_id}")
+
+    # scandir的DirEntry自带stat缓存，每个文件不再多一次stat系统调用
+    audio_files = []
+    other_files = []
+    if os.path.isdir(session_dir):
+        with os.scandir(session_dir) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+
+                stat = entry.stat()
+                ext = os.path.splitext(entry.name)[1].lower()
+                mime_type = _MIME_CACHE.get(ext) or mimetypes.guess_type(entry.name)[0]
+
+                info = {
+                    "filename": entry.name,
                     "size": stat.st_size,
-                    "created_at": "2024-01-01T00:00:00Z",  # TODO: 使用实际创建时间
+                    "created_at": datetime.fromtimestamp(stat.st_ctime).isoformat(),
                     "mime_type": mime_type,
-                    "download_url": f"/api/v1/media/{session_id}/{filename}"
-                })
+                    "download_url": f"/api/v1/media/{session_id}/{entry.name}"
+                }
+                if mime_type and mime_type.startswith("audio/"):
+                    audio_files.append(info)
+                else:
+                    other_files.append(info)
 
     return {
         "success": True,
         "data": {
-            "audio_files": [f for f in files if f["mime_type"] and f["mime_type"].startswith("audio/")],
-            "other_files": [f for f in files if not f["mime_type"] or not f["mime_type"].startswith("audio/")]
+            "audio_files": audio_files,
+            "other_files": other_files
         }
     }
\ No newline at end of file
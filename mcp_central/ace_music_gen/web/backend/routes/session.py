@@ -1,15 +1,19 @@
 """会话管理路由"""
 
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from typing import Optional
+from datetime import datetime
 import asyncio
 
+import anyio
+
 from ..models.requests import SessionStartRequest
 from ..models.responses import (
     SessionStartResponse, SessionStateResponse, SessionResultResponse,
     SessionListResponse, ErrorResponse
 )
-from ..state_tracker import state_tracker
+from ..state_tracker import state_tracker, sse_frame
 
 router = APIRouter(prefix="/session", tags=["session"])
 
@@ -38,10 +42,25 @@ async def start_session(request: SessionStartRequest):
         )
 
 
+# 会话记录数超过这个阈值时，快照重建转到线程池，不占事件循环
+_INLINE_SERIALIZE_LIMIT = 50
+
+
 @router.get("/{session_id}/state", response_model=SessionStateResponse)
 async def get_session_state(session_id: str):
     """获取会话当前状态"""
-    session_data = state_tracker.get_session_data(session_id)
+    session = state_tracker.get_session(session_id)
+    if session is not None and (
+        len(session.conversation_history) + len(session.lyrics_versions)
+        > _INLINE_SERIALIZE_LIMIT
+    ):
+        # 长会话的全量序列化是纯CPU活，放线程池跑，SSE推送不被卡住；
+        # 命中版本缓存时线程里也只是一次dict读取
+        session_data = await asyncio.to_thread(
+            state_tracker.get_session_data, session_id
+        )
+    else:
+        session_data = state_tracker.get_session_data(session_id)
 
     if not session_data:
         raise HTTPException(
@@ -112,33 +131,36 @@ async def stream_session_events(session_id: str):
             }
         )
 
-    from fastapi.responses import StreamingResponse
-    import json
-
     async def event_stream():
-        queue = state_tracker.register_sse_queue(session_id)
+        frames, wakeup = state_tracker.register_sse_queue(session_id)
 
         # 发送初始连接事件
-        yield f"event: connected\ndata: {json.dumps({'session_id': session_id})}\n\n"
+        yield sse_frame("connected", {"session_id": session_id})
 
         try:
             while True:
-                # 等待新事件，带超时
-                try:
-                    event = await asyncio.wait_for(queue.get(), timeout=30.0)
-
-                    event_type = event.get("event", "message")
-                    event_data = json.dumps(event.get("data", {}), ensure_ascii=False)
-
-                    yield f"event: {event_type}\ndata: {event_data}\n\n"
-
-                except asyncio.TimeoutError:
-                    # 发送心跳
-                    yield f"event: heartbeat\ndata: {json.dumps({'timestamp': '2024-01-01T00:00:00Z'})}\n\n"
+                # 等唤醒事件，带超时；缓冲里已是序列化好的bytes帧
+                if not frames:
+                    try:
+                        with anyio.fail_after(15.0):
+                            await wakeup.wait()
+                    except TimeoutError:
+                        # 发送心跳
+                        yield sse_frame("heartbeat", {"timestamp": datetime.now().isoformat()})
+                        continue
+
+                wakeup.clear()
+
+                # 把积压的帧合并成一次写出，调试日志刷屏时少掉大量小包
+                batch = []
+                while frames:
+                    batch.append(frames.popleft())
+                if batch:
+                    yield batch[0] if len(batch) == 1 else b"".join(batch)
 
         except asyncio.CancelledError:
             # 客户端断开连接
-            yield f"event: disconnected\ndata: {json.dumps({'session_id': session_id})}\n\n"
+            yield sse_frame("disconnected", {"session_id": session_id})
 
     return StreamingResponse(
         event_stream(),
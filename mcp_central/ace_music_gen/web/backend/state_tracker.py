@@ -7,14 +7,53 @@ import asyncio
 import json
 import time
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Callable
+from typing import Dict, Any, Optional, List, Callable, Tuple
 from dataclasses import asdict
+from itertools import islice
 from threading import Lock
+from types import MappingProxyType
 import uuid
 
+import orjson
+from collections import deque
+
 from src.ace_music_gen.session_state import MusicSessionState, ConversationTurn
 
 
+# 每个SSE订阅流最多缓冲的事件数，满了丢最旧的，慢客户端不拖住发布方
+_SSE_BUFFER_SIZE = 256
+
+def sse_frame(event_type: str, data: Dict[str, Any]) -> bytes:
+    """拼出单个SSE帧（orjson直接产出UTF-8字节，省掉ensure_ascii转义）"""
+    return b"event: " + event_type.encode("ascii") + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+# 阶段元数据表：每次调用重建dict太浪费，挂到模块级只建一次
+_STAGE_PROGRESS = MappingProxyType({
+    "initializing": 0,
+    "collecting_requirements": 20,
+    "generating_lyrics": 40,
+    "reviewing_lyrics": 60,
+    "preparing_generation": 70,
+    "generating_music": 85,
+    "evaluating_results": 95,
+    "completed": 100,
+    "failed": 0
+})
+
+_STAGE_DESC = MappingProxyType({
+    "initializing": "初始化会话...",
+    "collecting_requirements": "收集用户需求",
+    "generating_lyrics": "生成歌词候选版本",
+    "reviewing_lyrics": "等待用户审核歌词",
+    "preparing_generation": "准备音乐生成参数",
+    "generating_music": "调用MCP生成音乐",
+    "evaluating_results": "评估音频质量",
+    "completed": "音乐生成完成",
+    "failed": "生成失败"
+})
+
+
 class AgentStateTracker:
     """Agent 状态跟踪器"""
 
@@ -22,7 +61,19 @@ class AgentStateTracker:
         self._sessions: Dict[str, MusicSessionState] = {}
         self._session_lock = Lock()
         self._event_callbacks: Dict[str, List[Callable]] = {}
-        self._sse_queues: Dict[str, asyncio.Queue] = {}
+        self._sse_deques: Dict[str, deque] = {}
+        self._sse_wakeups: Dict[str, asyncio.Event] = {}
+        self._progress_events: Dict[str, asyncio.Event] = {}
+        # 每个会话因缓冲满被丢弃的事件数，用于观察SSE背压
+        self._dropped_events: Dict[str, int] = {}
+        # get_session_data的快照缓存：(版本号, 序列化结果)。
+        # 前端1-2秒轮询一次，会话空闲时直接命中，不再重走全量序列化
+        self._session_data_cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        # 各会话SSE流所属的事件循环；线程池里发事件时要跨线程投递
+        self._loops: Dict[str, asyncio.AbstractEventLoop] = {}
+        # user_requirement的asdict缓存：(需求对象, 序列化结果)。
+        # 需求对象只会被整体替换，不会原地改字段，按身份比较即可
+        self._requirement_cache: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
 
     def create_session(self, config: Optional[Dict[str, Any]] = None) -> str:
         """创建新会话"""
@@ -32,7 +83,9 @@ class AgentStateTracker:
             session = MusicSessionState(session_id=session_id)
             session.add_debug_log("会话已创建")
             self._sessions[session_id] = session
-            self._sse_queues[session_id] = asyncio.Queue()
+            self._sse_deques[session_id] = deque(maxlen=_SSE_BUFFER_SIZE)
+            self._sse_wakeups[session_id] = asyncio.Event()
+            self._remember_loop(session_id)
 
         self._emit_event(session_id, "session_created", {
             "session_id": session_id,
@@ -43,9 +96,12 @@ class AgentStateTracker:
         return session_id
 
     def get_session(self, session_id: str) -> Optional[MusicSessionState]:
-        """获取会话状态"""
-        with self._session_lock:
-            return self._sessions.get(session_id)
+        """获取会话状态
+
+        纯读取不拿锁：CPython的dict.get本身是原子的，会话一旦创建
+        就不会被替换，读到的引用始终有效。
+        """
+        return self._sessions.get(session_id)
 
     def update_stage(self, session_id: str, stage: str, description: str = "",
                     progress: float = 0.0, metadata: Optional[Dict[str, Any]] = None):
@@ -57,20 +113,10 @@ class AgentStateTracker:
 
             session.update_stage(stage)
             session.add_debug_log(f"阶段更新: {stage}")
+            self._bump_version(session)
 
             # 计算进度百分比
-            stage_progress_map = {
-                "initializing": 0,
-                "collecting_requirements": 20,
-                "generating_lyrics": 40,
-                "reviewing_lyrics": 60,
-                "preparing_generation": 70,
-                "generating_music": 85,
-                "evaluating_results": 95,
-                "completed": 100,
-                "failed": 0
-            }
-            calculated_progress = stage_progress_map.get(stage, progress)
+            calculated_progress = _STAGE_PROGRESS.get(stage, progress)
 
         self._emit_event(session_id, "state_update", {
             "stage": stage,
@@ -78,6 +124,7 @@ class AgentStateTracker:
             "progress": calculated_progress,
             "timestamp": datetime.now().isoformat()
         })
+        self._notify_progress(session_id)
 
         return True
 
@@ -96,12 +143,18 @@ class AgentStateTracker:
             )
             session.conversation_history.append(turn)
 
+            # 缓存最近一条用户消息，省掉消费方对历史的反向线性扫描
+            if role == "user":
+                session.last_user_turn = turn
+            self._bump_version(session)
+
         self._emit_event(session_id, "chat_message", {
             "role": role,
             "content": content,
             "timestamp": datetime.now().isoformat(),
             "metadata": metadata or {}
         })
+        self._notify_progress(session_id)
 
         return True
 
@@ -114,6 +167,7 @@ class AgentStateTracker:
                 return False
 
             session.add_debug_log(message)
+            self._bump_version(session)
 
         self._emit_event(session_id, "debug_log", {
             "level": level,
@@ -124,6 +178,29 @@ class AgentStateTracker:
 
         return True
 
+    def add_debug_logs(self, session_id: str, messages: List[str],
+                       level: str = "INFO"):
+        """批量添加调试日志：只取一次锁，SSE侧合并成单个debug_batch帧"""
+        if not messages:
+            return True
+
+        with self._session_lock:
+            session = self._sessions.get(session_id)
+            if not session:
+                return False
+
+            for message in messages:
+                session.add_debug_log(message)
+            self._bump_version(session)
+
+        self._emit_event(session_id, "debug_batch", {
+            "level": level,
+            "lines": list(messages),
+            "timestamp": datetime.now().isoformat()
+        })
+
+        return True
+
     def set_error(self, session_id: str, error_message: str,
                  error_code: str = "AGENT_ERROR"):
         """设置会话错误"""
@@ -134,6 +211,7 @@ class AgentStateTracker:
 
             session.update_stage("failed")
             session.add_debug_log(f"错误: {error_message}")
+            self._bump_version(session)
 
         self._emit_event(session_id, "error", {
             "error": error_message,
@@ -149,7 +227,19 @@ class AgentStateTracker:
         if not session:
             return None
 
-        # 转换为可序列化的数据
+        # 版本号没变说明状态没动过，直接回上次的快照
+        version = getattr(session, '_tracker_version', 0)
+        cached = self._session_data_cache.get(session_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        # 时间戳整个快照只取一次，日志条目复用它
+        now_iso = datetime.now().isoformat()
+
+        # 转换为可序列化的数据：记录都是字段齐全的dataclass，
+        # 直接走session自带的序列化helper，不再逐属性getattr兜底
+        record_to_dict = MusicSessionState._record_to_dict
+
         conversation_history = []
         for turn in session.conversation_history:
             conversation_history.append({
@@ -171,36 +261,21 @@ class AgentStateTracker:
             })
 
         user_requirement = {}
-        if session.user_requirement:
-            user_requirement = asdict(session.user_requirement)
-
-        # 处理ReAct元信息
-        actions = []
-        for action in getattr(session, 'actions', []):
-            actions.append({
-                "action_type": getattr(action, 'action_type', ''),
-                "action_data": getattr(action, 'action_data', {}),
-                "timestamp": getattr(action, 'timestamp', datetime.now()).isoformat(),
-                "result": getattr(action, 'result', None),
-                "error": getattr(action, 'error', None),
-                "duration_seconds": getattr(action, 'duration_seconds', None)
-            })
-
-        thoughts = getattr(session, 'thoughts', [])
-
-        final_assets = []
-        for asset in getattr(session, 'final_assets', []):
-            final_assets.append({
-                "asset_type": getattr(asset, 'asset_type', ''),
-                "asset_id": getattr(asset, 'asset_id', ''),
-                "file_path": getattr(asset, 'file_path', None),
-                "content": getattr(asset, 'content', None),
-                "metadata": getattr(asset, 'metadata', {}),
-                "created_at": getattr(asset, 'created_at', datetime.now()).isoformat(),
-                "is_final": getattr(asset, 'is_final', False)
-            })
-
-        return {
+        req = session.user_requirement
+        if req:
+            cached_req = self._requirement_cache.get(session_id)
+            if cached_req is not None and cached_req[0] is req:
+                user_requirement = cached_req[1]
+            else:
+                user_requirement = asdict(req)
+                self._requirement_cache[session_id] = (req, user_requirement)
+
+        # 处理ReAct元信息；先切片再序列化，不为被丢弃的记录做无用功
+        actions = [record_to_dict(a) for a in session.actions[-10:]]
+        final_assets = [record_to_dict(a) for a in session.final_assets]
+        thoughts = session.thoughts
+
+        data = {
             "session_id": session.session_id,
             "current_stage": session.current_stage,
             "stage_description": self._get_stage_description(session.current_stage),
@@ -210,19 +285,21 @@ class AgentStateTracker:
             "lyrics_versions": lyrics_versions,
             "debug_logs": [
                 {
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": now_iso,
                     "level": "INFO",
                     "message": log,
                     "metadata": {}
                 }
-                for log in session.debug_logs[-10:]  # 只返回最近10条
+                for log in list(session.debug_logs)[-10:]  # 只返回最近10条
             ],
             "react_metadata": {
-                "actions": actions[-10:],  # 最近10个行动
-                "thoughts": thoughts[-20:],  # 最近20个思考
+                "actions": actions,  # 最近10个行动
+                "thoughts": list(thoughts)[-20:],  # 最近20个思考
                 "final_assets": final_assets
             }
         }
+        self._session_data_cache[session_id] = (version, data)
+        return data
 
     def get_session_result(self, session_id: str) -> Optional[Dict[str, Any]]:
         """获取会话最终结果"""
@@ -239,7 +316,7 @@ class AgentStateTracker:
             for i, path in enumerate(audio_paths):
                 if path:  # 确保路径不为空
                     # 构造相对URL路径
-                    filename = path.split('/')[-1] if '/' in path else path
+                    filename = path.rsplit('/', 1)[-1]
                     # 安全获取元数据
                     metadata = getattr(result, 'metadata', {})
                     evaluation_scores = getattr(result, 'evaluation_scores', {})
@@ -282,41 +359,32 @@ class AgentStateTracker:
 
     def list_sessions(self, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
         """列出会话"""
+        # dict本身按插入序（即创建序）排列，倒着切片就是最新在前，
+        # 不用全量拷贝再排序。len()是原子操作，不需要进锁；
+        # 锁只护住分页迭代那一小段，防止线程池里的create_session
+        # 在迭代途中改动dict
+        total = len(self._sessions)
         with self._session_lock:
-            sessions = list(self._sessions.values())
-
-        # 按创建时间排序
-        sessions.sort(key=lambda s: s.session_id, reverse=True)
-
-        # 分页
-        total = len(sessions)
-        paginated_sessions = sessions[offset:offset + limit]
+            paginated_sessions = list(islice(
+                reversed(self._sessions.values()), offset, offset + limit
+            ))
 
         session_summaries = []
         for session in paginated_sessions:
+            # 轻量快照，不展开会话历史等大数组
+            snapshot = session.to_summary_dict()
             summary = {
-                "session_id": session.session_id,
-                "created_at": datetime.now().isoformat(),  # 暂时使用当前时间
-                "status": session.current_stage,
+                "session_id": snapshot["session_id"],
+                "created_at": snapshot["created_at"],
+                "status": snapshot["current_stage"],
                 "summary": {}
             }
 
             if session.user_requirement:
-                # 安全获取用户需求信息
-                style = getattr(session.user_requirement, 'style', '')
-                duration = getattr(session.user_requirement, 'duration', 30)
-
-                # 安全获取音频数量
-                audio_count = 0
-                if session.generation_result:
-                    audio_paths = getattr(session.generation_result, 'audio_paths', [])
-                    if audio_paths and isinstance(audio_paths, list):
-                        audio_count = len(audio_paths)
-
                 summary["summary"] = {
-                    "style": style,
-                    "duration": duration,
-                    "audio_count": audio_count
+                    "style": session.user_requirement.style,
+                    "duration": session.user_requirement.duration,
+                    "audio_count": snapshot["audio_count"]
                 }
 
             session_summaries.append(summary)
@@ -327,58 +395,109 @@ class AgentStateTracker:
             "has_more": offset + limit < total
         }
 
-    def register_sse_queue(self, session_id: str) -> asyncio.Queue:
-        """注册SSE队列"""
-        if session_id not in self._sse_queues:
-            self._sse_queues[session_id] = asyncio.Queue()
-        return self._sse_queues[session_id]
+    @staticmethod
+    def _bump_version(session: MusicSessionState):
+        """状态变更时递增版本号，作废get_session_data的缓存"""
+        session._tracker_version = getattr(session, '_tracker_version', 0) + 1
+
+    def get_progress_event(self, session_id: str) -> asyncio.Event:
+        """获取会话的进度事件（懒创建），状态更新时被set，供轮询方等待"""
+        event = self._progress_events.get(session_id)
+        if event is None:
+            event = self._progress_events.setdefault(session_id, asyncio.Event())
+        # 等待方在自己的循环里取事件，记下循环供跨线程唤醒用
+        self._remember_loop(session_id)
+        return event
+
+    def _notify_progress(self, session_id: str):
+        """有新状态时唤醒等待中的ReAct循环
+
+        和_emit_event同一条规矩：asyncio.Event不能跨线程set，
+        从线程池线程触发时把set调度回等待方所在的循环执行。
+        """
+        event = self._progress_events.get(session_id)
+        if event is None:
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        loop = self._loops.get(session_id)
+        if loop is not None and running is not loop:
+            loop.call_soon_threadsafe(event.set)
+        else:
+            event.set()
+
+    def register_sse_queue(self, session_id: str) -> Tuple[deque, asyncio.Event]:
+        """注册SSE订阅，返回(帧缓冲, 唤醒事件)"""
+        if session_id not in self._sse_deques:
+            self._sse_deques[session_id] = deque(maxlen=_SSE_BUFFER_SIZE)
+            self._sse_wakeups[session_id] = asyncio.Event()
+        self._remember_loop(session_id)
+        return self._sse_deques[session_id], self._sse_wakeups[session_id]
+
+    def _remember_loop(self, session_id: str):
+        """记下会话SSE流所属的事件循环（在线程里调用时没有循环，跳过）"""
+        try:
+            self._loops[session_id] = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
 
     def _emit_event(self, session_id: str, event_type: str, data: Dict[str, Any]):
-        """发送事件到SSE队列"""
-        if session_id in self._sse_queues:
-            event = {
-                "event": event_type,
-                "data": data
-            }
-            try:
-                self._sse_queues[session_id].put_nowait(event)
-            except asyncio.QueueFull:
-                # 队列满了，丢弃最旧的事件
-                try:
-                    self._sse_queues[session_id].get_nowait()
-                    self._sse_queues[session_id].put_nowait(event)
-                except asyncio.QueueEmpty:
-                    pass
+        """发送事件到SSE流
+
+        入队前就序列化成不可变的bytes帧，订阅方直接往连接上写，
+        同一事件不会被每个消费者重复编码。从线程池线程发事件时，
+        投递动作被调度回订阅方所在的事件循环执行，因为唤醒用的
+        asyncio.Event不能跨线程set。
+        """
+        if session_id not in self._sse_deques:
+            return
+
+        frame = sse_frame(event_type, data)
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        loop = self._loops.get(session_id)
+        if loop is not None and running is not loop:
+            loop.call_soon_threadsafe(self._deliver_frame, session_id, frame)
+        else:
+            self._deliver_frame(session_id, frame)
+
+    def _deliver_frame(self, session_id: str, frame: bytes):
+        """把帧追加进缓冲并唤醒订阅方；必须在订阅方的循环线程里跑
+
+        deque(maxlen)满了会自动挤掉最旧的帧，只需记一笔背压。
+        """
+        dq = self._sse_deques.get(session_id)
+        if dq is None:
+            return
+
+        if len(dq) == dq.maxlen:
+            self._dropped_events[session_id] = \
+                self._dropped_events.get(session_id, 0) + 1
+        dq.append(frame)
+
+        wakeup = self._sse_wakeups.get(session_id)
+        if wakeup is not None:
+            wakeup.set()
+
+    def dropped_event_count(self, session_id: str) -> int:
+        """该会话因SSE缓冲满被丢弃的事件数"""
+        return self._dropped_events.get(session_id, 0)
 
     def _get_stage_description(self, stage: str) -> str:
         """获取阶段描述"""
-        descriptions = {
-            "initializing": "初始化会话...",
-            "collecting_requirements": "收集用户需求",
-            "generating_lyrics": "生成歌词候选版本",
-            "reviewing_lyrics": "等待用户审核歌词",
-            "preparing_generation": "准备音乐生成参数",
-            "generating_music": "调用MCP生成音乐",
-            "evaluating_results": "评估音频质量",
-            "completed": "音乐生成完成",
-            "failed": "生成失败"
-        }
-        return descriptions.get(stage, stage)
+        return _STAGE_DESC.get(stage, stage)
 
     def _calculate_progress(self, stage: str) -> float:
         """计算进度百分比"""
-        progress_map = {
-            "initializing": 0,
-            "collecting_requirements": 20,
-            "generating_lyrics": 40,
-            "reviewing_lyrics": 60,
-            "preparing_generation": 70,
-            "generating_music": 85,
-            "evaluating_results": 95,
-            "completed": 100,
-            "failed": 0
-        }
-        return progress_map.get(stage, 0)
+        return _STAGE_PROGRESS.get(stage, 0)
 
 
 # 全局状态跟踪器实例